@@ -0,0 +1,85 @@
+"""
+Timing benchmarks for the collector's hot paths, using pyperf.
+
+Run with::
+
+    python benchmarks/bench_collector.py -o results.json
+
+and compare two runs with::
+
+    python -m pyperf compare_to before.json after.json
+"""
+import itertools
+import sys
+import time
+from os.path import abspath
+from os.path import dirname
+
+import pyperf
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.testing import FakeAgent
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from common import NullDogStatsd  # noqa: E402
+from common import fill  # noqa: E402
+from common import make_tag_sets  # noqa: E402
+
+
+def bench_record(loops, method, series, tags_per_series):
+    collector = DogstatsdCollector(NullDogStatsd())
+    record = getattr(collector, method)
+    tag_sets = itertools.cycle(make_tag_sets(series, tags_per_series))
+    start = time.perf_counter()
+    for _ in range(loops):
+        record('bench.metric', 1, next(tag_sets))
+    return time.perf_counter() - start
+
+
+def bench_flush(loops, dogstatsd, series, base_tags):
+    collector = DogstatsdCollector(dogstatsd, base_tags=base_tags)
+    fill(collector, series)
+    start = time.perf_counter()
+    for _ in range(loops):
+        collector.flush()
+    return time.perf_counter() - start
+
+
+def bench_create(loops):
+    dogstatsd = NullDogStatsd()
+    start = time.perf_counter()
+    for _ in range(loops):
+        DogstatsdCollector(dogstatsd)
+    return time.perf_counter() - start
+
+
+def main():
+    runner = pyperf.Runner()
+
+    runner.bench_time_func('create', bench_create)
+
+    for method in ('increment', 'histogram'):
+        runner.bench_time_func('{}[1 series, no tags]'.format(method), bench_record, method, 1, 0)
+        for series in (1, 100, 100000):
+            for tags_per_series in (1, 5, 10):
+                name = '{}[{} series, {} tags]'.format(method, series, tags_per_series)
+                runner.bench_time_func(name, bench_record, method, series, tags_per_series)
+
+    base_tags = ['env:bench', 'service:collector']
+    agent = FakeAgent(parse=False).start()
+    emitter = agent.emitter()
+    for series in (1, 100, 10000):
+        runner.bench_time_func(
+            'flush[{} series, no base tags]'.format(series), bench_flush, NullDogStatsd(), series, None
+        )
+        runner.bench_time_func(
+            'flush[{} series, base tags]'.format(series), bench_flush, NullDogStatsd(), series, base_tags
+        )
+        runner.bench_time_func(
+            'flush[{} series, DatagramEmitter]'.format(series), bench_flush, emitter, series, base_tags
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Reports the memory used per series and the datagrams and bytes emitted per
+flush at realistic cardinalities.
+
+Run with::
+
+    python benchmarks/bench_footprint.py
+"""
+import gc
+import sys
+import tracemalloc
+from os.path import abspath
+from os.path import dirname
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.testing import FakeAgent
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from common import NullDogStatsd  # noqa: E402
+from common import fill  # noqa: E402
+from common import make_tag_sets  # noqa: E402
+
+SERIES = (1, 100, 100000)
+TAGS_PER_SERIES = (1, 5, 10)
+
+
+def peak_memory_per_series(series, tags_per_series):
+    # Build the tag lists (and warm the tag interner) outside of the traced
+    # section, since callers own their tag lists.
+    tag_sets = make_tag_sets(series, tags_per_series)
+    warm = DogstatsdCollector(NullDogStatsd())
+    for tags in tag_sets:
+        warm.increment('bench.metric', tags=tags)
+    del warm
+    gc.collect()
+
+    tracemalloc.start()
+    collector = DogstatsdCollector(NullDogStatsd())
+    for tags in tag_sets:
+        collector.increment('bench.metric', tags=tags)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / float(series)
+
+
+def emitted_per_flush(agent, series, base_tags):
+    emitter = agent.emitter()
+    collector = DogstatsdCollector(emitter, base_tags=base_tags)
+    fill(collector, series)
+    agent.reset()
+    collector.flush()
+    agent.wait_for(emitter.datagrams_sent)
+    emitter.close()
+    return agent.datagrams, agent.bytes
+
+
+def main():
+    print('Peak memory per series (bytes)')
+    print('{:>10} {:>6} {:>10}'.format('series', 'tags', 'bytes'))
+    for series in SERIES:
+        for tags_per_series in TAGS_PER_SERIES:
+            print('{:>10} {:>6} {:>10.1f}'.format(
+                series, tags_per_series, peak_memory_per_series(series, tags_per_series)
+            ))
+
+    print('')
+    print('Emitted per flush (one counter and one histogram per series)')
+    print('{:>10} {:>10} {:>10} {:>12}'.format('series', 'base tags', 'datagrams', 'bytes'))
+    agent = FakeAgent(parse=False).start()
+    for series in SERIES:
+        for base_tags in (None, ['env:bench', 'service:collector']):
+            datagrams, sent = emitted_per_flush(agent, series, base_tags)
+            print('{:>10} {:>10} {:>10} {:>12}'.format(series, 'yes' if base_tags else 'no', datagrams, sent))
+    agent.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures the sustained datagrams per second a local agent receives from many
+collectors flushing at once, and how many datagrams are lost on the way.
+
+Run with::
+
+    python benchmarks/bench_throughput.py [collectors] [flushes] [series]
+"""
+import sys
+import threading
+import time
+from os.path import abspath
+from os.path import dirname
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.testing import FakeAgent
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from common import fill  # noqa: E402
+
+#: The default number of collectors, flushes per collector and series per
+#: flush.
+DEFAULTS = [8, 100, 1000]
+
+
+def flush_repeatedly(agent, flushes, series, sent):
+    emitter = agent.emitter()
+    collector = DogstatsdCollector(emitter, base_tags=['env:bench', 'service:collector'])
+    for _ in range(flushes):
+        fill(collector, series)
+        collector.flush(reset=True)
+    emitter.close()
+    sent.append(emitter.datagrams_sent)
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:]]
+    collectors, flushes, series = args + DEFAULTS[len(args):]
+    agent = FakeAgent(parse=False).start()
+    sent = []
+    threads = [
+        threading.Thread(target=flush_repeatedly, args=(agent, flushes, series, sent))
+        for _ in range(collectors)
+    ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    agent.wait_for(sum(sent), timeout=1)
+    agent.stop()
+
+    total = sum(sent)
+    print('{} collectors x {} flushes x {} series'.format(collectors, flushes, series))
+    print('sent:     {:>10} datagrams in {:.2f}s ({:.0f}/s)'.format(total, elapsed, total / elapsed))
+    print('received: {:>10} datagrams ({:.0f}/s, {} bytes)'.format(agent.datagrams, agent.rate(), agent.bytes))
+    print('lost:     {:>10} datagrams ({:.2%})'.format(total - agent.datagrams, 1 - agent.datagrams / float(total or 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Helpers shared by the benchmarks.
+"""
+
+
+class NullDogStatsd(object):
+    """
+    A DogStatsD stand-in that does nothing, so benchmarks measure only the
+    collector.
+    """
+
+    def increment(self, metric, value=1, tags=None):
+        pass
+
+    def histogram(self, metric, value, tags=None):
+        pass
+
+
+def make_tag_sets(series, tags_per_series):
+    """
+    Return a list of tag lists with the given number of distinct series, each
+    with tags_per_series tags.
+    """
+    if tags_per_series == 0:
+        return [[]] * series
+    fixed = ['tag{}:value{}'.format(i, i) for i in range(1, tags_per_series)]
+    return [['series:{}'.format(i)] + fixed for i in range(series)]
+
+
+def fill(collector, series, tags_per_series=3):
+    """
+    Record one counter and one histogram value for each of the given number
+    of series.
+    """
+    for tags in make_tag_sets(series, tags_per_series):
+        collector.increment('bench.count', tags=tags)
+        collector.histogram('bench.time', 0.5, tags=tags)
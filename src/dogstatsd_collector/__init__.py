@@ -1,8 +1,46 @@
+from .aggregator import Aggregator
+from .aggregator import AggregatorEmitter
+from .aio import AsyncDatagramEmitter
+from .background import BackgroundSender
+from .background import configure_background_sender
 from .base import DogstatsdCollector
+from .emitter import DatagramEmitter
+from .emitter import UnixDatagramEmitter
+from .interval import IntervalFlusher
+from .pool import CollectorPool
+from .pool import configure_collector_pool
+from .retry import RetryBuffer
+from .sampling import AdaptiveSampler
+from .scope import collector_scope
+from .scope import current_collector
+from .scope import histogram
+from .scope import increment
+from .stats import CollectorStats
+from .threaded import ThreadedDogstatsdCollector
+from .timing import Timer
 
 __version__ = '0.1.0'
 
 __all__ = [
     '__version__',
+    'AdaptiveSampler',
+    'Aggregator',
+    'AggregatorEmitter',
+    'AsyncDatagramEmitter',
+    'BackgroundSender',
+    'CollectorPool',
+    'CollectorStats',
+    'DatagramEmitter',
     'DogstatsdCollector',
+    'IntervalFlusher',
+    'RetryBuffer',
+    'ThreadedDogstatsdCollector',
+    'Timer',
+    'UnixDatagramEmitter',
+    'collector_scope',
+    'configure_background_sender',
+    'configure_collector_pool',
+    'current_collector',
+    'histogram',
+    'increment',
 ]
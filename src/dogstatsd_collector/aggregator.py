@@ -0,0 +1,209 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+from .base import DogstatsdCollector
+from .emitter import DEFAULT_UNIX_PAYLOAD_SIZE
+from .emitter import DatagramEmitter
+from .emitter import UnixDatagramEmitter
+
+log = logging.getLogger(__name__)
+
+#: The default maximum size, in bytes, of a payload sent to an aggregator.
+#: Unix datagram sockets allow much larger datagrams than UDP over Ethernet.
+DEFAULT_AGGREGATOR_PAYLOAD_SIZE = DEFAULT_UNIX_PAYLOAD_SIZE
+
+#: The largest payload an aggregator reads from its socket.
+MAX_RECEIVE_SIZE = 65536
+
+#: Maps DogStatsD datagram types to the collector metric types.
+DATAGRAM_TYPES = dict((v, k) for k, v in DatagramEmitter.METRIC_TYPES.items())
+
+
+def parse_line(line):
+    """
+    Parse a DogStatsD datagram line into a (metric_type, metric, value, tags)
+    tuple, where metric_type is one of the collector metric types. Sampled
+    counter values are scaled by their sample rate. Raises ValueError if the
+    line is malformed, of an unsupported type or has a sample rate outside
+    (0, 1].
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    metric, rest = line.split(':', 1)
+    fields = rest.split('|')
+    if len(fields) < 2 or fields[1] not in DATAGRAM_TYPES:
+        raise ValueError('Unsupported DogStatsD line: {!r}'.format(line))
+    metric_type = DATAGRAM_TYPES[fields[1]]
+    value = float(fields[0])
+    tags = []
+    for field in fields[2:]:
+        if field.startswith('#'):
+            tags = field[1:].split(',')
+        elif field.startswith('@'):
+            sample_rate = float(field[1:])
+            if not 0 < sample_rate <= 1:
+                raise ValueError('Invalid sample rate in DogStatsD line: {!r}'.format(line))
+            if metric_type == 'increment':
+                # Scale sampled counters back up to the total they stand for.
+                value /= sample_rate
+    return metric_type, metric, value, tags
+
+
+class AggregatorEmitter(UnixDatagramEmitter):
+    """
+    A UnixDatagramEmitter for pre-fork worker processes that sends flushed
+    series to an Aggregator listening on a local Unix datagram socket,
+    instead of to the DogStatsD agent.
+
+    :type path: str
+    :param path: The path of the aggregator's socket.
+
+    :type max_payload_size: int
+    :param max_payload_size: The maximum number of bytes to pack into a single
+                             payload.
+    """
+
+    def __init__(self, path, max_payload_size=DEFAULT_AGGREGATOR_PAYLOAD_SIZE):
+        super(AggregatorEmitter, self).__init__(path, max_payload_size=max_payload_size)
+
+
+class Aggregator(object):
+    """
+    Combines the series flushed by many worker processes on a host and sends
+    one set of series to DogStatsD per interval, cutting the number of
+    packets the agent receives by about the number of workers. Runs in the
+    parent process (or a sidecar); workers pass an AggregatorEmitter for the
+    same path to their collectors.
+
+    Counters from all workers are summed into a single series with a
+    DogstatsdCollector. Histogram values are passed through unmerged, since
+    summing them would change the distribution, but are repacked into full
+    payloads along with the counters. Histogram lines are sent as soon as
+    they fill a payload, rather than held until the interval ends, so a burst
+    of them cannot grow the aggregator's memory without bound.
+
+    :type emitter: DatagramEmitter
+    :param emitter: The emitter used to send the aggregated series.
+
+    :type path: str
+    :param path: The path of the Unix datagram socket to listen on.
+
+    :type interval: float
+    :param interval: How often, in seconds, to send the aggregated series.
+    """
+
+    def __init__(self, emitter, path, interval=10):
+        self.emitter = emitter
+        self.path = path
+        self.interval = interval
+        self.collector = DogstatsdCollector(emitter)
+        self._histogram_lines = []
+        self._histogram_bytes = 0
+        self._socket = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Bind the socket and start receiving and sending series in a
+        background thread.
+        """
+        self._bind()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.serve_forever, name='dogstatsd-collector-aggregator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, sending any series aggregated since the
+        last interval, and remove the socket.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            os.unlink(self.path)
+
+    def serve_forever(self):
+        """
+        Receive and aggregate payloads, sending the aggregated series every
+        interval, until stop() is called.
+        """
+        sock = self._bind()
+        next_flush = time.time() + self.interval
+        while not self._stopped.is_set():
+            # Wake up at least every 100ms to notice stop().
+            sock.settimeout(min(max(next_flush - time.time(), 0.001), 0.1))
+            try:
+                self.handle_payload(sock.recv(MAX_RECEIVE_SIZE))
+            except socket.timeout:
+                pass
+            if time.time() >= next_flush:
+                self.flush()
+                next_flush += self.interval
+        # Aggregate whatever workers sent before stop() was called.
+        sock.setblocking(0)
+        while True:
+            try:
+                self.handle_payload(sock.recv(MAX_RECEIVE_SIZE))
+            except (socket.timeout, BlockingIOError):
+                break
+        self.flush()
+
+    def handle_payload(self, payload):
+        """
+        Aggregate a payload of newline-delimited DogStatsD lines.
+        """
+        for line in payload.split(b'\n'):
+            if not line:
+                continue
+            try:
+                metric_type, metric, value, tags = parse_line(line)
+            except ValueError:
+                log.warning('Dropping malformed DogStatsD line: %r', line)
+                continue
+            if metric_type == 'histogram':
+                # _histogram_bytes counts a newline after every buffered
+                # line, so this is the size of the payload with line added.
+                if self._histogram_bytes + len(line) > self.emitter.max_payload_size and self._histogram_lines:
+                    self._send_histogram_lines()
+                self._histogram_lines.append(line.decode('utf-8'))
+                self._histogram_bytes += len(line) + 1
+            else:
+                self.collector.increment(metric, value, tags)
+
+    def flush(self):
+        """
+        Send every series aggregated since the last flush.
+        """
+        containers = self.collector.swap()
+        lines = [
+            self.emitter.format_line(*series)
+            for series in self.collector._iter_series(containers)
+        ]
+        lines.extend(self._take_histogram_lines())
+        self.emitter.emit_lines(lines)
+
+    def _send_histogram_lines(self):
+        self.emitter.emit_lines(self._take_histogram_lines())
+
+    def _take_histogram_lines(self):
+        lines, self._histogram_lines = self._histogram_lines, []
+        self._histogram_bytes = 0
+        return lines
+
+    def _bind(self):
+        if self._socket is None:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(self.path)
+            self._socket = sock
+        return self._socket
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+
+from .emitter import DEFAULT_MAX_PAYLOAD_SIZE
+from .emitter import DatagramEmitter
+
+log = logging.getLogger(__name__)
+
+
+class _EmitterProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def pause_writing(self):
+        self._writable.clear()
+
+    def resume_writing(self):
+        self._writable.set()
+
+    def error_received(self, exc):
+        log.warning('Error sending DogStatsD payload: %s', exc)
+
+    def connection_lost(self, exc):
+        # Never leave a sender waiting on a transport that is gone.
+        self._writable.set()
+
+    async def wait_writable(self):
+        await self._writable.wait()
+
+
+class AsyncDatagramEmitter(DatagramEmitter):
+    """
+    A DatagramEmitter that can also send payloads from an asyncio event loop
+    without blocking it. Pass it to a DogstatsdCollector and await
+    DogstatsdCollector.aflush() instead of calling flush().
+
+    A single asyncio datagram transport is created the first time the
+    emitter is used from a loop and reused afterwards. When the transport's
+    write buffer fills up, sending waits for it to drain instead of growing
+    the buffer without bound.
+
+    Takes the same arguments as DatagramEmitter, plus:
+
+    :type write_buffer_limit: int
+    :param write_buffer_limit: The number of bytes that may be buffered in
+                               the transport before sending waits for the
+                               buffer to drain.
+
+    A retry_buffer is only used when sending from synchronous code, e.g.
+    DogstatsdCollector.flush(); the transport reports errors asynchronously,
+    after aemit_series() has handed the payload over.
+    """
+
+    def __init__(self, host='localhost', port=8125, max_payload_size=DEFAULT_MAX_PAYLOAD_SIZE,
+                 write_buffer_limit=64 * 1024, retry_buffer=None):
+        super(AsyncDatagramEmitter, self).__init__(
+            host=host, port=port, max_payload_size=max_payload_size, retry_buffer=retry_buffer,
+        )
+        self.write_buffer_limit = write_buffer_limit
+        self._transport = None
+        self._protocol = None
+        self._loop = None
+
+    async def aemit_series(self, series):
+        """
+        Format and send an iterable of (metric_type, metric, value, tags)
+        tuples from the running event loop. See emit_series().
+        """
+        lines = (self.format_line(*s) for s in series)
+        for payload in self.pack(lines):
+            transport, protocol = await self._get_transport()
+            await protocol.wait_writable()
+            transport.sendto(payload)
+            self.datagrams_sent += 1
+            self.bytes_sent += len(payload)
+
+    def close(self):
+        """
+        Close the underlying socket and transport, if they have been opened.
+        """
+        super(AsyncDatagramEmitter, self).close()
+        if self._transport is not None:
+            # A transport whose loop has already been closed is closed with it.
+            if not self._loop.is_closed():
+                self._transport.close()
+            self._transport = None
+            self._protocol = None
+            self._loop = None
+
+    async def _get_transport(self):
+        loop = asyncio.get_running_loop()
+        if self._is_open(loop):
+            return self._transport, self._protocol
+        transport, protocol = await loop.create_datagram_endpoint(
+            _EmitterProtocol,
+            remote_addr=(self.host, self.port),
+        )
+        if self._is_open(loop):
+            # Another task created a transport while we were waiting.
+            transport.close()
+            return self._transport, self._protocol
+        transport.set_write_buffer_limits(high=self.write_buffer_limit)
+        self._transport = transport
+        self._protocol = protocol
+        self._loop = loop
+        return transport, protocol
+
+    def _is_open(self, loop):
+        # A transport belongs to the loop it was created on, so a new one is
+        # needed if the emitter is later used from a different loop.
+        return (
+            self._transport is not None
+            and not self._transport.is_closing()
+            and self._loop is loop
+        )
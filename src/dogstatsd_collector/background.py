@@ -0,0 +1,175 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+#: Drop the oldest queued snapshot to make room for a new one.
+DROP_OLDEST = 'drop_oldest'
+#: Drop the new snapshot.
+DROP_NEWEST = 'drop_newest'
+#: Block the flushing thread until there is room for the new snapshot.
+BLOCK = 'block'
+
+#: The policies a BackgroundSender supports for a full queue.
+FULL_QUEUE_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+#: The default maximum number of snapshots waiting to be sent.
+DEFAULT_MAX_QUEUE_SIZE = 1000
+
+#: How long to wait, in seconds, for queued snapshots to be sent at exit.
+DEFAULT_EXIT_TIMEOUT = 5
+
+_STOP = object()
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+class BackgroundSender(object):
+    """
+    Sends collector snapshots from a background thread. Snapshots are handed
+    over through a bounded queue; the thread formats and emits them, taking
+    that work off the flushing thread.
+
+    :type max_queue_size: int
+    :param max_queue_size: The maximum number of snapshots waiting to be sent.
+
+    :type policy: str
+    :param policy: What to do when a snapshot is submitted to a full queue;
+                   one of DROP_OLDEST, DROP_NEWEST or BLOCK.
+    """
+
+    def __init__(self, max_queue_size=DEFAULT_MAX_QUEUE_SIZE, policy=DROP_OLDEST):
+        if policy not in FULL_QUEUE_POLICIES:
+            raise ValueError('Unknown full queue policy: {}'.format(policy))
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        #: The number of snapshots dropped because the queue was full.
+        self.dropped = 0
+        #: The number of snapshots sent.
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def submit(self, collector, containers):
+        """
+        Queue a snapshot of a collector's metric containers (as returned by
+        DogstatsdCollector.swap()) to be emitted by the collector from the
+        background thread. Returns False if the snapshot was dropped.
+        """
+        self._ensure_started()
+        item = (collector, containers)
+        if self.policy == BLOCK:
+            self._queue.put(item)
+            return True
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if self.policy == DROP_NEWEST:
+                    self._count_dropped()
+                    return False
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                continue
+            self._queue.task_done()
+            self._count_dropped()
+
+    def drain(self):
+        """
+        Wait until every snapshot queued so far has been sent.
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self, timeout=DEFAULT_EXIT_TIMEOUT):
+        """
+        Send the snapshots already queued and stop the background thread,
+        waiting at most timeout seconds.
+        """
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            log.warning('Timed out stopping the DogStatsD background sender')
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # The thread (and possibly the queue's locks) did not survive
+                # a fork, so start over in the child.
+                self._reset()
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='dogstatsd-collector-sender')
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+
+    def _reset(self):
+        self._queue = queue.Queue(self.max_queue_size)
+        self._thread = None
+        self._pid = os.getpid()
+
+    def _count_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                collector, containers = item
+                collector._emit(containers)
+                self.sent += 1
+            except Exception:
+                log.exception('Error sending DogStatsD metrics in the background')
+            finally:
+                self._queue.task_done()
+
+
+def get_background_sender():
+    """
+    Return the process-wide BackgroundSender used by
+    DogstatsdCollector.flush(background=True), creating it if needed.
+    """
+    global _sender
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                _sender = BackgroundSender()
+    return _sender
+
+
+def configure_background_sender(max_queue_size=DEFAULT_MAX_QUEUE_SIZE, policy=DROP_OLDEST):
+    """
+    Replace the process-wide BackgroundSender with one using the given queue
+    size and full queue policy. The previous sender is stopped after sending
+    the snapshots it already has queued.
+    """
+    global _sender
+    with _sender_lock:
+        previous = _sender
+        _sender = BackgroundSender(max_queue_size=max_queue_size, policy=policy)
+    if previous is not None:
+        previous.stop()
+    return _sender
+
+
+@atexit.register
+def _stop_at_exit():
+    if _sender is not None:
+        _sender.stop()
@@ -1,4 +1,29 @@
 from collections import defaultdict
+from random import random
+from time import perf_counter
+
+from . import snapshot
+from .aio import AsyncDatagramEmitter
+from .background import get_background_sender
+from .emitter import DatagramEmitter
+from .handles import HistogramStoreHandle
+from .handles import RecordingHandle
+from .handles import SeriesHandle
+from .histograms import DEFAULT_MAX_SAMPLES
+from .histograms import HISTOGRAM_MODES
+from .histograms import SUM
+from .histograms import SUMMARY
+from .histograms import HistogramStore
+from .stats import STATS_METRIC_PREFIX
+from .stats import CollectorStats
+from .tags import TagInterner
+from .timing import Timer
+
+_NO_TAGS = frozenset()
+
+
+def _new_series():
+    return defaultdict(float)
 
 
 class DogstatsdCollector(object):
@@ -7,64 +32,684 @@ class DogstatsdCollector(object):
     metrics in-memory and then emits them when flush() is called. Each series
     (metric and all combination of tag key-value pairs) is emitted separately.
 
-    :type dogstatsd: datadog.dogstatsd.base.DogStatsD
-    :param dogstatsd: The DogStatsD object to use for emitting metrics.
+    :type dogstatsd: datadog.dogstatsd.base.DogStatsD or DatagramEmitter
+    :param dogstatsd: The DogStatsD object to use for emitting metrics. If a
+                      DatagramEmitter is given, all series are emitted in
+                      batched payloads instead of one call per series.
 
     :type base_tags: list
     :param base_tags: A list of tags to be included on every metric emitted from
                       the collector. Should be of the form ['tag:value', ...]
+
+    :type histogram_modes: dict
+    :param histogram_modes: A dict mapping histogram metric names to how their
+                            values are collected and emitted: 'sum' (the
+                            default) emits the sum of the values recorded for
+                            a series as one histogram value, 'samples' emits
+                            each value, and 'summary' emits the count, min,
+                            max, avg and percentiles of the values as
+                            <metric>.count, <metric>.min, etc.
+
+    :type max_histogram_samples: int
+    :param max_histogram_samples: For 'samples' and 'summary' histograms, the
+                                  number of exact values kept per series
+                                  before switching to a bounded-memory
+                                  quantile sketch.
+
+    :type max_series_per_metric: int
+    :param max_series_per_metric: The maximum number of series (tag sets)
+                                  collected for a single metric. Values for
+                                  further series are folded into a single
+                                  series tagged 'overflow:true'.
+
+    :type max_series: int
+    :param max_series: The maximum number of series collected across all
+                       metrics, with overflow handled the same way.
+
+    :type parent: DogstatsdCollector
+    :param parent: If given, flushing this collector merges its series into
+                   the parent instead of emitting them. See child().
+
+    :type collect_stats: bool
+    :param collect_stats: If True, count what the collector itself costs in
+                          a CollectorStats, available as the stats attribute.
+
+    :type emit_stats: bool
+    :param emit_stats: If True, collect stats and also emit them as
+                       dogstatsd_collector.* metrics after every flush.
+
+    :type adaptive_sampler: AdaptiveSampler
+    :param adaptive_sampler: If given, increment() and histogram() calls for
+                             metrics recorded more often than the sampler
+                             allows are sampled automatically.
+
+    :type max_bytes: int
+    :param max_bytes: If given, an estimate of the memory the collected
+                      series may use. The estimate grows with every new
+                      series; once it passes max_bytes, the collector flushes
+                      with reset=True right away, so memory stays bounded
+                      however long the unit of work runs. See
+                      partial_flushes.
     """
 
     #: The DogStatsD metrics supported by the collector.
     SUPPORTED_DOGSTATSD_METRICS = ['histogram', 'increment']
 
-    def __init__(self, dogstatsd, base_tags=None):
+    #: The attribute holding the container for each supported metric.
+    _CONTAINER_ATTRS = {
+        'histogram': '_histograms',
+        'increment': '_increments',
+    }
+
+    #: The percentiles emitted for 'summary' histograms.
+    SUMMARY_PERCENTILES = (50, 95, 99)
+
+    #: The number of timers timed() keeps for reuse.
+    MAX_CACHED_TIMERS = 1024
+
+    #: The tags of the series that values are folded into once a metric or
+    #: the collector has reached its maximum number of series.
+    OVERFLOW_TAGS = ('overflow:true',)
+
+    #: The estimated memory, in bytes, of a series (its dict entry, value and
+    #: tag key), of the dict holding a metric's series, and of a
+    #: HistogramStore not counting its samples, as counted against
+    #: max_bytes. Tag keys are counted even though they may be shared, since
+    #: the tag interner stops sharing them at high cardinality.
+    SERIES_BYTES = 300
+    METRIC_BYTES = 300
+    HISTOGRAM_STORE_BYTES = 200
+
+    def __init__(self, dogstatsd, base_tags=None, histogram_modes=None,
+                 max_histogram_samples=DEFAULT_MAX_SAMPLES, max_series_per_metric=None,
+                 max_series=None, parent=None, collect_stats=False, emit_stats=False,
+                 adaptive_sampler=None, max_bytes=None):
         self.dogstatsd = dogstatsd
-        for metric in self.SUPPORTED_DOGSTATSD_METRICS:
-            setattr(
-                self,
-                '_{}s'.format(metric),
-                defaultdict(lambda: defaultdict(float))
-            )
+        self.parent = parent
+        #: A CollectorStats if collect_stats or emit_stats is True, else None.
+        self.stats = CollectorStats() if collect_stats or emit_stats else None
+        self.emit_stats = emit_stats
+        self.adaptive_sampler = adaptive_sampler
+        self._init_containers()
         if base_tags is None:
             base_tags = []
         self.base_tags = base_tags
+        self._tag_interner = TagInterner.for_base_tags(base_tags)
+        self._tag_keys = self._tag_interner._keys
+        if histogram_modes is None:
+            histogram_modes = {}
+        self.histogram_modes = histogram_modes
+        self.max_histogram_samples = max_histogram_samples
+        # Only histograms that keep their values need a HistogramStore.
+        self._stored_histograms = _NO_TAGS
+        if histogram_modes:
+            for metric, mode in histogram_modes.items():
+                if mode not in HISTOGRAM_MODES:
+                    raise ValueError('Unknown histogram mode for {}: {}'.format(metric, mode))
+            self._stored_histograms = frozenset(
+                metric for metric, mode in histogram_modes.items() if mode != SUM
+            )
+        self.max_series_per_metric = max_series_per_metric
+        self.max_series = max_series
+        #: The names of the metrics that have had values folded into their
+        #: overflow series.
+        self.capped_metrics = set()
+        self.max_bytes = max_bytes
+        #: The number of times the collector flushed early because it
+        #: reached max_bytes.
+        self.partial_flushes = 0
+        self._limits_series = (
+            max_series_per_metric is not None
+            or max_series is not None
+            or max_bytes is not None
+        )
+        self._handles = {}
+        self._timers = {}
 
-    def increment(self, metric, value=1, tags=None):
+    def increment(self, metric, value=1, tags=None, sample_rate=None):
         """
         Track a DogStatsD counter metric.
+
+        :type sample_rate: float
+        :param sample_rate: If given, only record this fraction of calls,
+                            scaling each recorded value up by 1 / sample_rate
+                            so the emitted total stays correct. Skipped calls
+                            return without touching the collected series.
         """
-        self._record_metric('increment', metric, value, tags)
+        if sample_rate is not None or self.adaptive_sampler is not None:
+            sample_rate = self._get_sample_rate(metric, sample_rate)
+            if sample_rate < 1.0:
+                if random() >= sample_rate:
+                    return
+                value = value / sample_rate
+        self._record_metric(self._increments, metric, value, tags)
 
-    def histogram(self, metric, value, tags=None):
+    def histogram(self, metric, value, tags=None, sample_rate=None):
         """
         Track a DogStatsD histogram metric.
+
+        :type sample_rate: float
+        :param sample_rate: See increment(). Values of 'samples' and
+                            'summary' histograms are a sample of the
+                            distribution and are recorded unscaled, with a
+                            weight of 1 / sample_rate: 'summary' counts are
+                            scaled up by it, and 'samples' values are
+                            emitted with a sample rate by a
+                            DatagramEmitter.
+        """
+        weight = 1
+        if sample_rate is not None or self.adaptive_sampler is not None:
+            sample_rate = self._get_sample_rate(metric, sample_rate)
+            if sample_rate < 1.0:
+                if random() >= sample_rate:
+                    return
+                if metric in self._stored_histograms:
+                    weight = 1 / sample_rate
+                else:
+                    value = value / sample_rate
+        if metric in self._stored_histograms:
+            self._record_histogram_value(self._histograms, metric, value, tags, weight)
+        else:
+            self._record_metric(self._histograms, metric, value, tags)
+
+    def increment_many(self, metrics, values=None, tags=None):
+        """
+        Track many DogStatsD counter values at once. Either pass an iterable of
+        (metric, value, tags) tuples, or a metric name with an iterable of
+        values (such as a NumPy array) that share the same tags. Values are
+        summed per series before being recorded, so the series key is only
+        resolved once per distinct series.
+        """
+        self._record_many('increment', metrics, values, tags)
+
+    def histogram_many(self, metrics, values=None, tags=None):
+        """
+        Track many DogStatsD histogram values at once. Takes the same arguments
+        as increment_many().
+        """
+        self._record_many('histogram', metrics, values, tags)
+
+    def counter(self, metric, tags=None):
+        """
+        Return a handle bound to a counter series, whose add() method
+        increments it. Handles are meant for tight loops: they skip the
+        series lookup that increment() does on every call, and stay valid
+        across flushes and resets. Series whose handles add up to 0 are not
+        emitted.
+        """
+        return self._get_handle('increment', metric, tags)
+
+    def histogram_handle(self, metric, tags=None):
+        """
+        Return a handle bound to a histogram series, whose add() method
+        records a value. See counter().
+        """
+        return self._get_handle('histogram', metric, tags)
+
+    def timed(self, metric, tags=None, use_ms=False):
+        """
+        Return a Timer that records the duration of a block of code, when used
+        as a context manager, or of every call to a function, when used as a
+        decorator, as a histogram value. Durations are measured with
+        time.perf_counter_ns() and recorded in seconds, or in milliseconds if
+        use_ms is True. The same Timer is returned for the same arguments,
+        so timing a block repeatedly does not allocate. Once
+        MAX_CACHED_TIMERS timers are cached, a new Timer that records through
+        histogram() is returned instead, so timing with unbounded tag sets
+        does not grow the collector. Decorated coroutine functions are
+        timed until their coroutine completes.
+
+        .. code-block:: python
+
+            with collector.timed('db.query.time', tags=['table:x']):
+                run_query()
+
+            @collector.timed('render.time', use_ms=True)
+            def render():
+                ...
+        """
+        timer_key = (metric, tuple(tags) if tags else (), use_ms)
+        timer = self._timers.get(timer_key)
+        if timer is None:
+            if len(self._timers) >= self.MAX_CACHED_TIMERS:
+                return Timer(RecordingHandle(self, 'histogram', metric, tags), use_ms)
+            timer = self._timers[timer_key] = Timer(self.histogram_handle(metric, tags), use_ms)
+        return timer
+
+    def dumps(self):
+        """
+        Return a snapshot of the series collected so far, and the base tags,
+        as compact bytes that can be sent to another process and loaded
+        there with loads(). Metric names and tags are written once each, in
+        a string table. The collector is left unchanged.
+        """
+        return snapshot.dumps(self._get_metric_containers(), self.base_tags)
+
+    @classmethod
+    def loads(cls, data, dogstatsd, **kwargs):
         """
-        self._record_metric('histogram', metric, value, tags)
+        Return a new collector holding the series in a snapshot written by
+        dumps(), with the snapshot's base tags. data can be any bytes-like
+        object, such as a memoryview of shared memory; it is read in place.
+        Other keyword arguments are passed to the constructor. Merge the
+        result into a parent collector to emit several processes' series
+        together:
 
-    def flush(self):
+        .. code-block:: python
+
+            for data in snapshots:
+                collector += DogstatsdCollector.loads(data, collector.dogstatsd)
+        """
+        base_tags, containers = snapshot.loads(data)
+        collector = cls(dogstatsd, base_tags=base_tags, **kwargs)
+        collector._merge_containers(containers, base_tags)
+        return collector
+
+    def merge(self, other):
+        """
+        Merge the series collected by another collector into this one, so
+        they are emitted by this collector's next flush. The other collector
+        is left unchanged. Also available as the += operator.
+        """
+        self._merge_containers(other._get_metric_containers(), other.base_tags)
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def child(self):
+        """
+        Return a new collector with the same configuration whose flush()
+        merges its series into this one instead of emitting them. Use this
+        to collect per-request series that are emitted together, e.g. every
+        few seconds, by a longer-lived parent collector.
+        """
+        return DogstatsdCollector(
+            self.dogstatsd,
+            base_tags=self.base_tags,
+            histogram_modes=self.histogram_modes,
+            max_histogram_samples=self.max_histogram_samples,
+            parent=self,
+        )
+
+    def flush(self, reset=False, background=False):
         """
         Flush all metrics, emitting each metric once per series (combination of
         tag key-value pairs).
+
+        :type reset: bool
+        :param reset: If True, swap in empty containers before emitting, so
+                      the flushed series are not emitted again by the next
+                      flush and metrics recorded while emitting are kept for
+                      the next flush.
+
+        :type background: bool
+        :param background: If True, swap in empty containers (as with
+                           reset=True) and hand the previous ones to the
+                           process-wide background sender thread, which
+                           formats and emits them. See
+                           configure_background_sender(). Collectors with a
+                           parent merge into it on the flushing thread.
+        """
+        if background and self.parent is None:
+            if not get_background_sender().submit(self, self.swap()) and self.stats is not None:
+                self.stats.dropped_flushes += 1
+            return
+        if reset or background:
+            containers = self.swap()
+        else:
+            containers = self._get_metric_containers()
+        self._emit(containers)
+
+    async def aflush(self, reset=False):
+        """
+        Flush all metrics from a running asyncio event loop. If the collector
+        was created with an AsyncDatagramEmitter, payloads are sent without
+        blocking the loop; otherwise this is the same as flush().
+
+        :type reset: bool
+        :param reset: See flush().
+        """
+        if reset:
+            containers = self.swap()
+        else:
+            containers = self._get_metric_containers()
+        if isinstance(self.dogstatsd, AsyncDatagramEmitter) and self.parent is None:
+            start = perf_counter()
+            sent = self._get_emitter_totals()
+            await self.dogstatsd.aemit_series(self._iter_series(containers))
+            if self.stats is not None:
+                self._record_flush_stats(containers, start, sent)
+        else:
+            self._emit(containers)
+
+    def swap(self):
+        """
+        Install empty metric containers and return the previous ones as a dict
+        keyed by metric type. This is O(1) regardless of the number of series
+        collected; the returned containers are no longer written to by the
+        collector.
+        """
+        containers = self._get_metric_containers()
+        self._init_containers()
+        return containers
+
+    def reset(self):
+        """
+        Drop every series collected so far, including values added through
+        handles, so the collector can be reused as if it were new. Unlike
+        swap(), the existing containers are cleared in place rather than
+        replaced, which makes reset() the cheapest way to reuse a collector
+        after a synchronous flush(). See CollectorPool.
+
+        Handles and timers are dropped too, so a reused collector does not
+        keep every series any of its users has timed or held a handle to;
+        ones obtained before reset() no longer record into the collector.
         """
+        self._handles.clear()
+        self._timers.clear()
         for metric_type in self.SUPPORTED_DOGSTATSD_METRICS:
-            self._flush_metric(metric_type)
+            self._get_metric_container(metric_type).clear()
+        self._series_count = 0
+        self._bytes = 0
+        self.capped_metrics.clear()
 
-    def _flush_metric(self, metric_type):
-        container = self._get_metric_container(metric_type)
+    def _emit(self, containers):
+        stats = self.stats
+        if stats is not None:
+            start = perf_counter()
+            sent = self._get_emitter_totals()
+        self._send(containers)
+        if stats is not None:
+            self._record_flush_stats(containers, start, sent)
+
+    def _send(self, containers):
+        if self.parent is not None:
+            self.parent._merge_containers(containers, self.base_tags)
+            return
+        if isinstance(self.dogstatsd, DatagramEmitter):
+            self.dogstatsd.emit_series(self._iter_series(containers))
+            return
+        for metric_type in self.SUPPORTED_DOGSTATSD_METRICS:
+            self._flush_metric(metric_type, containers[metric_type])
+
+    def _get_emitter_totals(self):
+        if isinstance(self.dogstatsd, DatagramEmitter):
+            return self.dogstatsd.datagrams_sent, self.dogstatsd.bytes_sent, self.dogstatsd.payloads_dropped
+        return 0, 0, 0
+
+    def _record_flush_stats(self, containers, start, sent):
+        stats = self.stats
+        elapsed = perf_counter() - start
+        datagrams, bytes_sent, dropped = self._get_emitter_totals()
+        stats.flushes += 1
+        stats.flush_time += elapsed
+        stats.last_flush_time = elapsed
+        stats.datagrams += datagrams - sent[0]
+        stats.bytes += bytes_sent - sent[1]
+        stats.dropped_payloads += dropped - sent[2]
+        stats.series = dict(
+            (metric_type, sum(len(series) for series in containers[metric_type].values()))
+            for metric_type in self.SUPPORTED_DOGSTATSD_METRICS
+        )
+        if self.emit_stats:
+            self._send(self._get_stats_containers())
+
+    def _get_stats_containers(self):
+        stats = self.stats
+        increments = defaultdict(_new_series)
+        for name, delta in stats._take_deltas().items():
+            if delta:
+                increments['{}.{}'.format(STATS_METRIC_PREFIX, name)][_NO_TAGS] = delta
+        histograms = defaultdict(_new_series)
+        histograms['{}.flush_time'.format(STATS_METRIC_PREFIX)][_NO_TAGS] = stats.last_flush_time
+        for metric_type, count in stats.series.items():
+            key = self._get_tag_key(['metric_type:{}'.format(metric_type)])
+            histograms['{}.series'.format(STATS_METRIC_PREFIX)][key] = count
+        return {'histogram': histograms, 'increment': increments}
+
+    def _iter_series(self, containers):
+        serialized = self._tag_interner.serialized
+        for metric_type in self.SUPPORTED_DOGSTATSD_METRICS:
+            for metric, series in containers[metric_type].items():
+                for series, value in series.items():
+                    if isinstance(value, HistogramStore):
+                        for expanded_type, expanded_metric, expanded_value, rate in self._expand_histogram(metric, value):
+                            yield expanded_type, expanded_metric, expanded_value, serialized(series), rate
+                    else:
+                        yield metric_type, metric, value, serialized(series)
+
+    def _flush_metric(self, metric_type, container):
         dogstatsd_method = getattr(self.dogstatsd, metric_type)
+        tags_for = self._tag_interner.tags
         for metric, series in container.items():
             for series, value in series.items():
-                series = list(series)
-                series.extend(self.base_tags)
-                dogstatsd_method(metric, value, tags=sorted(series))
+                if isinstance(value, HistogramStore):
+                    # A DogStatsD client applies sample_rate by dropping
+                    # values itself, so the rate is only written by the
+                    # DatagramEmitter path (_iter_series).
+                    for expanded_type, expanded_metric, expanded_value, _ in self._expand_histogram(metric, value):
+                        getattr(self.dogstatsd, expanded_type)(expanded_metric, expanded_value, tags=tags_for(series))
+                else:
+                    dogstatsd_method(metric, value, tags=tags_for(series))
+
+    def _expand_histogram(self, metric, store):
+        # Yields (metric_type, metric, value, sample_rate) tuples. Values of a
+        # store that has spilled into a sketch stand for more values than
+        # are emitted, so they carry a sample rate for the agent to count
+        # them by when written as datagrams.
+        if self.histogram_modes.get(metric) == SUMMARY:
+            for suffix, value in store.summary(self.SUMMARY_PERCENTILES):
+                metric_type = 'increment' if suffix == 'count' else 'histogram'
+                yield metric_type, '{}.{}'.format(metric, suffix), value, 1.0
+        else:
+            rate = store.sample_rate()
+            for value in store.values():
+                yield 'histogram', metric, value, rate
+
+    def _get_sample_rate(self, metric, sample_rate):
+        if self.adaptive_sampler is None:
+            return sample_rate
+        rate = self.adaptive_sampler.rate(metric)
+        if sample_rate is None:
+            return rate
+        return rate * sample_rate
+
+    def _record_metric(self, container, metric, value, tags=None):
+        # This is the hot path, so the tag key lookup is inlined rather than
+        # going through _get_tag_key().
+        if self.stats is not None:
+            self.stats.record_calls += 1
+        if tags:
+            tags = tuple(tags)
+            try:
+                key = self._tag_keys[tags]
+            except KeyError:
+                key = self._tag_interner.key(tags)
+        else:
+            key = _NO_TAGS
+        series = container[metric]
+        if self._limits_series and key not in series:
+            key = self._limit_series(metric, series, key)
+            series[key] += value
+            if self.max_bytes is not None and self._bytes > self.max_bytes:
+                self._flush_partial()
+            return
+        series[key] += value
+
+    def _record_histogram_value(self, container, metric, value, tags=None, weight=1):
+        if self.stats is not None:
+            self.stats.record_calls += 1
+        self._get_histogram_store(container, metric, tags).add(value, weight)
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            self._flush_partial()
+
+    def _flush_partial(self):
+        self.partial_flushes += 1
+        if self.stats is not None:
+            self.stats.partial_flushes += 1
+        self.flush(reset=True)
+
+    def _record_many(self, metric_type, metrics, values, tags):
+        stored = self._stored_histograms if metric_type == 'histogram' else _NO_TAGS
+        if values is not None:
+            grouped = {(metrics, tuple(tags) if tags else ()): values}
+        else:
+            grouped = defaultdict(list)
+            for metric, value, series_tags in metrics:
+                grouped[metric, tuple(series_tags) if series_tags else ()].append(value)
+        for (metric, series_tags), series_values in grouped.items():
+            if hasattr(series_values, 'tolist'):
+                # Convert NumPy arrays to floats in one call.
+                series_values = series_values.tolist()
+            elif not isinstance(series_values, list):
+                series_values = list(series_values)
+            if not series_values:
+                continue
+            if self.stats is not None:
+                # Count every value; _record_metric() counts the one call
+                # that records a group's sum.
+                self.stats.record_calls += len(series_values) - (metric not in stored)
+            # Look the container up every time, since recording can flush
+            # and reset the collector when it reaches max_bytes.
+            container = self._get_metric_container(metric_type)
+            if metric in stored:
+                self._get_histogram_store(container, metric, series_tags).extend(series_values)
+                if self.max_bytes is not None and self._bytes > self.max_bytes:
+                    self._flush_partial()
+            else:
+                self._record_metric(container, metric, sum(series_values), series_tags)
+
+    def _get_histogram_store(self, container, metric, tags):
+        key = self._get_tag_key(tags)
+        series = container[metric]
+        if self._limits_series and key not in series:
+            key = self._limit_series(metric, series, key)
+        store = series.get(key)
+        if store is None:
+            store = series[key] = HistogramStore(self.max_histogram_samples)
+        return store
+
+    def _limit_series(self, metric, series, key):
+        # Called for a key that is not yet in series. The overflow series
+        # itself does not count towards either limit.
+        if (
+            (self.max_series_per_metric is not None and len(series) >= self.max_series_per_metric)
+            or (self.max_series is not None and self._series_count >= self.max_series)
+        ):
+            self.capped_metrics.add(metric)
+            if self.stats is not None:
+                self.stats.overflowed += 1
+            return self._get_tag_key(self.OVERFLOW_TAGS)
+        self._series_count += 1
+        if self.max_bytes is not None:
+            self._bytes += self.SERIES_BYTES
+            if not series:
+                self._bytes += self.METRIC_BYTES
+            if metric in self._stored_histograms:
+                self._bytes += self.HISTOGRAM_STORE_BYTES + 8 * self.max_histogram_samples
+        return key
+
+    def _get_tag_key(self, tags):
+        if not tags:
+            return _NO_TAGS
+        return self._tag_interner.key(tuple(tags))
+
+    def _init_containers(self):
+        self._series_count = 0
+        self._bytes = 0
+        self._histograms = defaultdict(_new_series)
+        self._increments = defaultdict(_new_series)
+
+    def _merge_containers(self, containers, base_tags):
+        # Series keys do not include base tags, so base tags of the other
+        # collector that this one lacks are added to every merged key.
+        extra_tags = None
+        if base_tags != self.base_tags:
+            extra_tags = frozenset(base_tags).difference(self.base_tags) or None
+        for metric_type, container in containers.items():
+            target = self._get_metric_container(metric_type)
+            for metric, series in container.items():
+                if not series:
+                    continue
+                if (
+                    self._limits_series
+                    or extra_tags is not None
+                    or metric in self._stored_histograms
+                    or isinstance(next(iter(series.values())), HistogramStore)
+                ):
+                    self._merge_series(metric, target[metric], series, extra_tags)
+                    continue
+                # Copying a dict is much cheaper than adding its entries one
+                # at a time, so copy the larger side and walk the smaller.
+                mine = target.get(metric)
+                if mine is None:
+                    target[metric] = defaultdict(float, series)
+                elif len(mine) < len(series):
+                    merged = defaultdict(float, series)
+                    for key, value in mine.items():
+                        merged[key] += value
+                    target[metric] = merged
+                else:
+                    for key, value in series.items():
+                        mine[key] += value
+
+    def _merge_series(self, metric, mine, series, extra_tags):
+        for key, value in series.items():
+            if extra_tags is not None:
+                key = self._tag_interner.key(tuple(key.union(extra_tags)))
+            if self._limits_series and key not in mine:
+                key = self._limit_series(metric, mine, key)
+            existing = mine.get(key)
+            if isinstance(value, HistogramStore):
+                if existing is None:
+                    existing = mine[key] = HistogramStore(self.max_histogram_samples)
+                if isinstance(existing, HistogramStore):
+                    existing.merge(value)
+                else:
+                    mine[key] += value.sum
+            elif isinstance(existing, HistogramStore):
+                existing.add(value)
+            else:
+                mine[key] += value
+
+    def _get_handle(self, metric_type, metric, tags):
+        key = self._get_tag_key(tags)
+        handle_key = (metric_type, metric, key)
+        handle = self._handles.get(handle_key)
+        if handle is None:
+            if metric_type == 'histogram' and metric in self._stored_histograms:
+                handle = HistogramStoreHandle(metric_type, metric, key, self.max_histogram_samples)
+            else:
+                handle = SeriesHandle(metric_type, metric, key)
+            self._handles[handle_key] = handle
+        return handle
+
+    def _fold_handles(self):
+        for handle in self._handles.values():
+            value = handle._drain()
+            if value is None:
+                continue
+            series = self._get_metric_container(handle.metric_type)[handle.metric]
+            key = handle.key
+            if self._limits_series and key not in series:
+                key = self._limit_series(handle.metric, series, key)
+            if isinstance(value, HistogramStore):
+                store = series.get(key)
+                if store is None:
+                    series[key] = value
+                else:
+                    store.merge(value)
+            else:
+                series[key] += value
 
-    def _record_metric(self, metric_type, metric, value, tags=None):
-        if tags is None:
-            tags = []
-        key = frozenset(tags)
-        self._get_metric_container(metric_type)[metric][key] += value
+    def _get_metric_containers(self):
+        if self._handles:
+            self._fold_handles()
+        return dict(
+            (metric_type, self._get_metric_container(metric_type))
+            for metric_type in self.SUPPORTED_DOGSTATSD_METRICS
+        )
 
     def _get_metric_container(self, metric_type):
-        attr = '_{}s'.format(metric_type)
-        return getattr(self, attr)
+        return getattr(self, self._CONTAINER_ATTRS[metric_type])
@@ -0,0 +1,42 @@
+from celery.signals import task_postrun
+from celery.signals import task_prerun
+
+from ..pool import get_collector_pool
+
+
+def connect(pool=None):
+    """
+    Connect Celery signal handlers that attach a collector from a
+    CollectorPool to every task as task.request.metrics, flush it after the
+    task has run and return it to the pool. Call once when the worker
+    starts.
+
+    .. code-block:: python
+
+        configure_collector_pool(DogStatsd())
+        connect()
+
+        @app.task(bind=True)
+        def my_task(self):
+            self.request.metrics.increment('my.count')
+
+    :type pool: CollectorPool
+    :param pool: The pool to take collectors from. Defaults to the
+                 process-wide pool; see configure_collector_pool().
+    """
+    def acquire_metrics(task=None, **kwargs):
+        task.request.metrics = (pool or get_collector_pool()).acquire()
+
+    def release_metrics(task=None, **kwargs):
+        metrics = getattr(task.request, 'metrics', None)
+        if metrics is None:
+            return
+        task.request.metrics = None
+        try:
+            metrics.flush()
+        finally:
+            (pool or get_collector_pool()).release(metrics)
+
+    task_prerun.connect(acquire_metrics, weak=False)
+    task_postrun.connect(release_metrics, weak=False)
+    return acquire_metrics, release_metrics
@@ -0,0 +1,38 @@
+from ..pool import get_collector_pool
+
+
+class MetricsMiddleware(object):
+    """
+    Django middleware that attaches a collector from the process-wide
+    CollectorPool to every request as request.metrics, flushes it once the
+    response is ready (or the view raised) and returns it to the pool.
+    Configure the pool at startup with configure_collector_pool(), or set
+    pool on a subclass.
+
+    .. code-block:: python
+
+        MIDDLEWARE = [
+            'dogstatsd_collector.contrib.django.MetricsMiddleware',
+            ...
+        ]
+    """
+
+    #: The CollectorPool to take collectors from. Defaults to the
+    #: process-wide pool.
+    pool = None
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pool = self.pool or get_collector_pool()
+        request.metrics = pool.acquire()
+        try:
+            return self.get_response(request)
+        finally:
+            metrics = request.metrics
+            del request.metrics
+            try:
+                metrics.flush()
+            finally:
+                pool.release(metrics)
@@ -0,0 +1,35 @@
+from flask import request
+
+from ..pool import get_collector_pool
+
+
+def init_app(app, pool=None):
+    """
+    Attach a collector from a CollectorPool to every request of a Flask app
+    as request.metrics, flush it when the request is torn down (even if the
+    view raised) and return it to the pool.
+
+    .. code-block:: python
+
+        app = Flask(__name__)
+        configure_collector_pool(DogStatsd())
+        init_app(app)
+
+    :type pool: CollectorPool
+    :param pool: The pool to take collectors from. Defaults to the
+                 process-wide pool; see configure_collector_pool().
+    """
+    @app.before_request
+    def acquire_metrics():
+        request.metrics = (pool or get_collector_pool()).acquire()
+
+    @app.teardown_request
+    def release_metrics(exc=None):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return
+        del request.metrics
+        try:
+            metrics.flush()
+        finally:
+            (pool or get_collector_pool()).release(metrics)
@@ -0,0 +1,263 @@
+import errno
+import logging
+import os
+import socket
+
+from .tags import serialize_tags
+
+log = logging.getLogger(__name__)
+
+#: The default maximum size, in bytes, of a single UDP payload. Fits in a
+#: standard 1500 byte Ethernet MTU once IP and UDP headers are accounted for.
+DEFAULT_MAX_PAYLOAD_SIZE = 1432
+
+#: The default maximum size, in bytes, of a single Unix datagram socket
+#: payload, which matches what the DogStatsD agent reads at once.
+DEFAULT_UNIX_PAYLOAD_SIZE = 8192
+
+#: The default path of the DogStatsD agent's Unix datagram socket.
+DEFAULT_SOCKET_PATH = '/var/run/datadog/dsd.socket'
+
+#: The send errors after which the socket is reopened for the next payload,
+#: e.g. because the agent restarted or its socket was removed. Other errors,
+#: such as a full socket buffer (EAGAIN or ENOBUFS) while the agent is busy,
+#: leave the socket open.
+RECONNECT_ERRNOS = frozenset([
+    errno.EBADF,
+    errno.ECONNREFUSED,
+    errno.ECONNRESET,
+    errno.ENOENT,
+    errno.ENOTCONN,
+    errno.EPIPE,
+])
+
+
+class DatagramEmitter(object):
+    """
+    Emits metrics directly in the DogStatsD datagram format, packing as many
+    series as will fit into each UDP payload. Can be passed to a
+    DogstatsdCollector in place of a DogStatsD object, in which case every
+    series in a flush is formatted and sent in as few payloads as possible
+    instead of one method call (and one datagram) per series.
+
+    The emitted datagrams are byte-for-byte the same as those DogStatsD would
+    send for the equivalent increment() and histogram() calls.
+
+    :type host: str
+    :param host: The host of the DogStatsD agent.
+
+    :type port: int
+    :param port: The port of the DogStatsD agent.
+
+    :type max_payload_size: int
+    :param max_payload_size: The maximum number of bytes to pack into a single
+                             payload. A single series larger than this is sent
+                             in a payload of its own.
+
+    :type retry_buffer: RetryBuffer
+    :param retry_buffer: If given, payloads that cannot be sent (e.g. while
+                         the agent restarts) are kept in the buffer and
+                         retried before later payloads, instead of being
+                         dropped. They are retried when the next payload is
+                         sent, or when replay() is called.
+    """
+
+    #: Maps the collector metric types to their DogStatsD datagram types.
+    METRIC_TYPES = {
+        'histogram': 'h',
+        'increment': 'c',
+    }
+
+    def __init__(self, host='localhost', port=8125, max_payload_size=DEFAULT_MAX_PAYLOAD_SIZE, retry_buffer=None):
+        self.host = host
+        self.port = port
+        self.max_payload_size = max_payload_size
+        self.retry_buffer = retry_buffer
+        #: The number of payloads sent.
+        self.datagrams_sent = 0
+        #: The number of bytes sent.
+        self.bytes_sent = 0
+        #: The number of payloads that could not be sent.
+        self.payloads_dropped = 0
+        self._socket = None
+        self._pid = None
+
+    def increment(self, metric, value=1, tags=None, sample_rate=None):
+        """
+        Emit a single DogStatsD counter metric.
+        """
+        self.emit_series([('increment', metric, value, serialize_tags(tags), sample_rate)])
+
+    def histogram(self, metric, value, tags=None, sample_rate=None):
+        """
+        Emit a single DogStatsD histogram metric.
+        """
+        self.emit_series([('histogram', metric, value, serialize_tags(tags), sample_rate)])
+
+    def emit_series(self, series):
+        """
+        Format and send an iterable of (metric_type, metric, value, tags)
+        tuples, where tags is an already serialized tag suffix (see
+        serialize_tags()), packing them into as few payloads as possible.
+        A tuple may have a fifth sample_rate item; see format_line().
+        """
+        self.emit_lines(self.format_line(*s) for s in series)
+
+    def emit_lines(self, lines):
+        """
+        Send an iterable of already formatted DogStatsD datagram lines,
+        packing them into as few payloads as possible.
+        """
+        for payload in self.pack(lines):
+            self._send(payload)
+
+    def format_series(self, metric_type, metric, value, tags=None):
+        """
+        Format a single series with a list of tags as a DogStatsD datagram
+        line.
+        """
+        return self.format_line(metric_type, metric, value, serialize_tags(tags))
+
+    def format_line(self, metric_type, metric, value, serialized_tags='', sample_rate=None):
+        """
+        Format a single series with an already serialized tag suffix as a
+        DogStatsD datagram line. If sample_rate is given and below 1, the
+        line is marked with it, and the agent counts the value as
+        1 / sample_rate values.
+        """
+        if sample_rate is not None and sample_rate < 1:
+            return '{}:{}|{}|@{}{}'.format(metric, value, self.METRIC_TYPES[metric_type], sample_rate, serialized_tags)
+        return '{}:{}|{}{}'.format(metric, value, self.METRIC_TYPES[metric_type], serialized_tags)
+
+    def pack(self, lines):
+        """
+        Pack an iterable of datagram lines into newline-delimited payloads of
+        at most max_payload_size bytes each.
+        """
+        buf = []
+        size = 0
+        for line in lines:
+            line = line.encode('utf-8')
+            # Every line after the first in a payload costs one extra byte for
+            # the newline separator.
+            needed = len(line) + (1 if buf else 0)
+            if buf and size + needed > self.max_payload_size:
+                yield b'\n'.join(buf)
+                buf = []
+                size = 0
+                needed = len(line)
+            buf.append(line)
+            size += needed
+        if buf:
+            yield b'\n'.join(buf)
+
+    def replay(self):
+        """
+        Try to send the payloads in the retry buffer, oldest first, unless
+        the backoff after the last failure has not elapsed yet. Called
+        automatically before every payload is sent. Returns True if the
+        buffer is now empty.
+        """
+        buffer = self.retry_buffer
+        if buffer is None or not len(buffer):
+            return True
+        if not buffer.ready():
+            return False
+        while True:
+            payload = buffer.peek()
+            if payload is None:
+                buffer.succeeded()
+                return True
+            try:
+                self._get_socket().send(payload)
+            except socket.error as e:
+                log.debug('Error resending DogStatsD payload', exc_info=True)
+                buffer.failed()
+                self._handle_send_error(e)
+                return False
+            buffer.pop()
+            self.datagrams_sent += 1
+            self.bytes_sent += len(payload)
+
+    def close(self):
+        """
+        Close the underlying socket, if one has been opened.
+        """
+        self._close_socket()
+
+    def _close_socket(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _handle_send_error(self, error):
+        if error.errno in RECONNECT_ERRNOS:
+            self._close_socket()
+
+    def _get_socket(self):
+        if self._socket is None or self._pid != os.getpid():
+            # A socket inherited across fork() is shared with the parent, so
+            # each process opens its own.
+            self._close_socket()
+            self._socket = self._connect()
+            self._pid = os.getpid()
+        return self._socket
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        sock.connect((self.host, self.port))
+        return sock
+
+    def _send(self, payload):
+        buffer = self.retry_buffer
+        if buffer is not None and len(buffer) and not self.replay():
+            # Keep payloads in order behind the ones still waiting.
+            self.payloads_dropped += buffer.add(payload)
+            return
+        try:
+            self._get_socket().send(payload)
+        except socket.error as e:
+            self._handle_send_error(e)
+            if buffer is None:
+                log.warning('Error sending DogStatsD payload', exc_info=True)
+                self.payloads_dropped += 1
+                return
+            log.warning('Error sending DogStatsD payload, buffering it for retry', exc_info=True)
+            buffer.failed()
+            self.payloads_dropped += buffer.add(payload)
+            return
+        self.datagrams_sent += 1
+        self.bytes_sent += len(payload)
+
+
+class UnixDatagramEmitter(DatagramEmitter):
+    """
+    A DatagramEmitter that sends to the DogStatsD agent over a Unix datagram
+    socket instead of UDP. Unix sockets cost the agent less CPU, do not lose
+    datagrams when the agent is busy (sending fails instead, see
+    retry_buffer), and allow larger payloads, so a flush takes far fewer
+    datagrams.
+
+    One socket is kept open per process and reopened after fork().
+
+    :type path: str
+    :param path: The path of the agent's socket.
+
+    :type max_payload_size: int
+    :param max_payload_size: The maximum number of bytes to pack into a single
+                             payload.
+
+    :type retry_buffer: RetryBuffer
+    :param retry_buffer: See DatagramEmitter.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, max_payload_size=DEFAULT_UNIX_PAYLOAD_SIZE, retry_buffer=None):
+        super(UnixDatagramEmitter, self).__init__(max_payload_size=max_payload_size, retry_buffer=retry_buffer)
+        self.path = path
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        sock.connect(self.path)
+        return sock
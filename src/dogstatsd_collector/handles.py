@@ -0,0 +1,101 @@
+from functools import partial
+
+from .histograms import HistogramStore
+
+
+class SeriesHandle(object):
+    """
+    A handle bound to a single counter or histogram series of a collector,
+    for recording in tight loops. add() is a single float addition; the
+    handle's value is folded into the collector whenever it is flushed or
+    swapped, so a handle stays valid across resets.
+
+    Get one from DogstatsdCollector.counter() or
+    DogstatsdCollector.histogram_handle().
+    """
+
+    __slots__ = ('metric_type', 'metric', 'key', 'value')
+
+    def __init__(self, metric_type, metric, key):
+        self.metric_type = metric_type
+        self.metric = metric
+        self.key = key
+        self.value = 0.0
+
+    def add(self, value=1):
+        """
+        Add a value to the series.
+        """
+        self.value += value
+
+    def _drain(self):
+        value = self.value
+        self.value = 0.0
+        return value or None
+
+
+class HistogramStoreHandle(object):
+    """
+    A handle bound to a single 'samples' or 'summary' histogram series of a
+    collector. Values are added to a HistogramStore owned by the handle and
+    merged into the collector whenever it is flushed or swapped.
+    """
+
+    __slots__ = ('metric_type', 'metric', 'key', 'store')
+
+    def __init__(self, metric_type, metric, key, max_samples):
+        self.metric_type = metric_type
+        self.metric = metric
+        self.key = key
+        self.store = HistogramStore(max_samples)
+
+    def add(self, value):
+        """
+        Add a value to the series.
+        """
+        self.store.add(value)
+
+    def _drain(self):
+        store = self.store
+        if not store.count:
+            return None
+        self.store = HistogramStore(store.max_samples)
+        return store
+
+
+class ShardedSeriesHandle(object):
+    """
+    A handle bound to a single series of a ThreadedDogstatsdCollector.
+    add() records into the calling thread's shard, so a handle can be shared
+    between threads and recording still never takes a lock.
+
+    Get one from ThreadedDogstatsdCollector.counter() or
+    ThreadedDogstatsdCollector.histogram_handle().
+    """
+
+    __slots__ = ('metric_type', 'metric', 'tags', '_record')
+
+    def __init__(self, collector, metric_type, metric, tags):
+        self.metric_type = metric_type
+        self.metric = metric
+        self.tags = tags
+        self._record = collector._record
+
+    def add(self, value=1):
+        """
+        Add a value to the series.
+        """
+        self._record(self.metric_type, self.metric, value, self.tags)
+
+
+class RecordingHandle(object):
+    """
+    A handle that records every value through the collector's increment()
+    or histogram(), and keeps nothing itself, so it never needs to be folded
+    into the collector.
+    """
+
+    __slots__ = ('add',)
+
+    def __init__(self, collector, metric_type, metric, tags):
+        self.add = partial(getattr(collector, metric_type), metric, tags=tags)
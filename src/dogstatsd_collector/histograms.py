@@ -0,0 +1,266 @@
+import math
+from array import array
+
+#: Sum every value recorded for a series and emit the total as a single
+#: histogram value, so each flush (e.g. each request) is one sample.
+SUM = 'sum'
+#: Emit every value recorded for a series as its own histogram value.
+SAMPLES = 'samples'
+#: Emit pre-computed count, min, max, avg and percentiles for a series.
+SUMMARY = 'summary'
+
+#: The histogram modes a collector supports.
+HISTOGRAM_MODES = (SUM, SAMPLES, SUMMARY)
+
+#: The default number of exact samples a HistogramStore keeps per series
+#: before it switches to a QuantileSketch.
+DEFAULT_MAX_SAMPLES = 256
+
+#: The default relative accuracy of the quantiles a QuantileSketch returns.
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch(object):
+    """
+    A mergeable quantile sketch (in the style of DDSketch) that uses a fixed
+    amount of memory per order of magnitude of the values added to it, and
+    returns quantiles within a relative accuracy of the true value.
+
+    :type relative_accuracy: float
+    :param relative_accuracy: The relative accuracy of returned quantiles.
+    """
+
+    __slots__ = ('relative_accuracy', 'count', 'min', 'max', 'sum', 'zero_count', 'positive', 'negative',
+                 '_gamma', '_log_gamma')
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.sum = 0.0
+        self.zero_count = 0
+        self.positive = {}
+        self.negative = {}
+
+    def add(self, value, count=1):
+        """
+        Add a value to the sketch count times. Raises ValueError for NaN and
+        infinite values, which have no place in the sketch's buckets.
+        """
+        if not math.isfinite(value):
+            raise ValueError('Cannot add {!r} to a sketch'.format(value))
+        if value > 0:
+            index = self._index(value)
+            self.positive[index] = self.positive.get(index, 0) + count
+        elif value < 0:
+            index = self._index(-value)
+            self.negative[index] = self.negative.get(index, 0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Merge another sketch with the same relative accuracy into this one.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracies')
+        # The other sketch may still be written to by another thread, so
+        # iterate over copies.
+        for index, count in list(other.positive.items()):
+            self.positive[index] = self.positive.get(index, 0) + count
+        for index, count in list(other.negative.items()):
+            self.negative[index] = self.negative.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Return the approximate value at quantile q (between 0 and 1).
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return self._clamp(-self._value(index))
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._clamp(self._value(index))
+        return self.max
+
+    def _index(self, value):
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _value(self, index):
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+    def _clamp(self, value):
+        return min(max(value, self.min), self.max)
+
+
+class HistogramStore(object):
+    """
+    A bounded-memory store of the values recorded for a single histogram
+    series. Keeps up to max_samples exact values in a compact array, then
+    moves them into a QuantileSketch so memory stays bounded no matter how
+    many values are recorded.
+
+    Values recorded with a sample rate stand for 1 / sample_rate values
+    each; the store keeps their total weight, the estimated number of values
+    they stand for, so counts stay correct. NaN and infinite values are
+    ignored.
+
+    :type max_samples: int
+    :param max_samples: The number of exact values to keep.
+    """
+
+    __slots__ = ('max_samples', 'samples', 'sketch', 'weight')
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.samples = array('d')
+        self.sketch = None
+        #: The number of values recorded, each weighted by 1 / its sample
+        #: rate.
+        self.weight = 0
+
+    def add(self, value, weight=1):
+        """
+        Record a value that stands for weight values (1 / its sample rate).
+        """
+        if not math.isfinite(value):
+            return
+        self.weight += weight
+        if self.sketch is not None:
+            self.sketch.add(value)
+            return
+        self.samples.append(value)
+        if len(self.samples) > self.max_samples:
+            self._spill()
+
+    def extend(self, values):
+        """
+        Record a sequence of values.
+        """
+        if not all(map(math.isfinite, values)):
+            values = [value for value in values if math.isfinite(value)]
+        self.weight += len(values)
+        if self.sketch is not None:
+            for value in values:
+                self.sketch.add(value)
+            return
+        self.samples.extend(values)
+        if len(self.samples) > self.max_samples:
+            self._spill()
+
+    def merge(self, other):
+        """
+        Merge the values recorded in another store into this one.
+        """
+        if other.sketch is not None:
+            if self.sketch is None:
+                self._spill()
+            self.sketch.merge(other.sketch)
+        for value in other.samples:
+            self.add(value, 0)
+        self.weight += other.weight
+
+    @property
+    def count(self):
+        if self.sketch is not None:
+            return self.sketch.count
+        return len(self.samples)
+
+    @property
+    def min(self):
+        if self.sketch is not None:
+            return self.sketch.min
+        return min(self.samples)
+
+    @property
+    def max(self):
+        if self.sketch is not None:
+            return self.sketch.max
+        return max(self.samples)
+
+    @property
+    def sum(self):
+        if self.sketch is not None:
+            return self.sketch.sum
+        return math.fsum(self.samples)
+
+    def quantile(self, q):
+        """
+        Return the value at quantile q (between 0 and 1); exact while the
+        store holds exact values, approximate once it has spilled into a
+        sketch.
+        """
+        if self.sketch is not None:
+            return self.sketch.quantile(q)
+        samples = sorted(self.samples)
+        return samples[int(round(q * (len(samples) - 1)))]
+
+    def values(self):
+        """
+        Return the values to emit as individual histogram samples. Once the
+        store has spilled into a sketch, this is max_samples values spread
+        evenly over the sketch's quantiles, which preserves the shape of the
+        distribution; emit them with sample_rate() so the number of values
+        recorded is preserved too.
+        """
+        if self.sketch is None:
+            return list(self.samples)
+        n = self.max_samples
+        return [self.sketch.quantile((i + 0.5) / n) for i in range(n)]
+
+    def sample_rate(self):
+        """
+        Return the fraction of the values recorded, by weight, that values()
+        stands for: 1.0 for exact values recorded without a sample rate,
+        and less once values were sampled or the store has spilled into a
+        sketch.
+        """
+        emitted = len(self.samples) if self.sketch is None else self.max_samples
+        if not self.weight or emitted >= self.weight:
+            return 1.0
+        return emitted / self.weight
+
+    def summary(self, percentiles):
+        """
+        Return a list of (suffix, value) pairs summarizing the store: count
+        (the weight of the values recorded), min, max, avg and each of the
+        given percentiles (0-100).
+        """
+        summary = [
+            ('count', self.weight),
+            ('min', self.min),
+            ('max', self.max),
+            ('avg', self.sum / self.count),
+        ]
+        for percentile in percentiles:
+            summary.append(('p{}'.format(percentile), self.quantile(percentile / 100.0)))
+        return summary
+
+    def _spill(self):
+        self.sketch = QuantileSketch()
+        for value in self.samples:
+            self.sketch.add(value)
+        self.samples = array('d')
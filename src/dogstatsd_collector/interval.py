@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+
+from .emitter import DatagramEmitter
+from .threaded import ThreadedDogstatsdCollector
+
+log = logging.getLogger(__name__)
+
+#: The default number of seconds between flushes.
+DEFAULT_FLUSH_INTERVAL = 10
+
+
+class IntervalFlusher(object):
+    """
+    Flushes a long-lived collector with reset=True every interval seconds
+    from a background thread, so each flush emits only the series recorded
+    since the previous one, with counters as deltas, and its cost scales
+    with activity rather than with every series ever seen.
+
+    The collector is flushed from the flusher's thread while other threads
+    record into it, so it must be a ThreadedDogstatsdCollector; a plain
+    DogstatsdCollector could lose the values of a whole interval if a
+    value was recorded during a flush. ThreadedDogstatsdCollector takes the
+    same options, such as histogram_modes and collect_stats.
+
+    If the collector emits to a DatagramEmitter with a retry buffer, every
+    flush also retries the buffered payloads, even when there is nothing new
+    to send.
+
+    .. code-block:: python
+
+        collector = ThreadedDogstatsdCollector(dogstatsd)
+        flusher = IntervalFlusher(collector, interval=10)
+        flusher.start()
+        ...
+        flusher.stop()
+
+    :type collector: ThreadedDogstatsdCollector
+    :param collector: The collector to flush.
+
+    :type interval: float
+    :param interval: The number of seconds between flushes.
+    """
+
+    def __init__(self, collector, interval=DEFAULT_FLUSH_INTERVAL):
+        if not isinstance(collector, ThreadedDogstatsdCollector):
+            raise TypeError('IntervalFlusher requires a ThreadedDogstatsdCollector, not {}'.format(
+                type(collector).__name__,
+            ))
+        self.collector = collector
+        self.interval = interval
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Start flushing in a background thread. Safe to call again, e.g. in a
+        forked child process whose copy of the thread did not survive the
+        fork.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return self
+        self._stopped.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='dogstatsd-collector-flusher')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        """
+        Stop the background thread and, unless flush is False, flush the
+        series recorded since the last interval.
+        """
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+        if flush:
+            self.flush()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def flush(self):
+        """
+        Flush the collector now, with reset=True, and retry any payloads
+        its emitter has buffered.
+        """
+        try:
+            self.collector.flush(reset=True)
+            emitter = self.collector.dogstatsd
+            if isinstance(emitter, DatagramEmitter):
+                emitter.replay()
+        except Exception:
+            log.exception('Error flushing DogStatsD metrics')
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
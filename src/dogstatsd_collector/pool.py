@@ -0,0 +1,99 @@
+import threading
+from contextlib import contextmanager
+
+from .base import DogstatsdCollector
+
+#: The default maximum number of idle collectors a pool keeps.
+DEFAULT_MAX_POOL_SIZE = 64
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class CollectorPool(object):
+    """
+    A pool of reusable collectors for per-request or per-task metrics.
+    Instead of building a new collector for every request, acquire() one
+    from the pool and release() it once it has been flushed; it is reset in
+    place and handed out again, so a busy process allocates collectors only
+    up to its peak concurrency.
+
+    acquire() and release() do not take a lock; they are safe to call from
+    multiple threads, although each collector must still only be used by
+    one thread at a time.
+
+    :type dogstatsd: datadog.dogstatsd.base.DogStatsD or DatagramEmitter
+    :param dogstatsd: The DogStatsD object the collectors emit to.
+
+    :type max_size: int
+    :param max_size: The maximum number of idle collectors to keep. Collectors
+                     released to a full pool are discarded.
+
+    Other keyword arguments are passed to DogstatsdCollector.
+    """
+
+    def __init__(self, dogstatsd, max_size=DEFAULT_MAX_POOL_SIZE, **collector_kwargs):
+        self.dogstatsd = dogstatsd
+        self.max_size = max_size
+        self.collector_kwargs = collector_kwargs
+        self._idle = []
+
+    def acquire(self):
+        """
+        Return an idle collector from the pool, or a new one if none is idle.
+        """
+        try:
+            return self._idle.pop()
+        except IndexError:
+            return DogstatsdCollector(self.dogstatsd, **self.collector_kwargs)
+
+    def release(self, collector):
+        """
+        Reset a collector and return it to the pool. Series that have not
+        been flushed are dropped.
+        """
+        collector.reset()
+        if len(self._idle) < self.max_size:
+            self._idle.append(collector)
+
+    @contextmanager
+    def collector(self):
+        """
+        A context manager that acquires a collector, flushes it on exit and
+        releases it back to the pool.
+
+        .. code-block:: python
+
+            with pool.collector() as metrics:
+                metrics.increment('my.count')
+        """
+        collector = self.acquire()
+        try:
+            yield collector
+        finally:
+            try:
+                collector.flush()
+            finally:
+                self.release(collector)
+
+
+def get_collector_pool():
+    """
+    Return the process-wide CollectorPool used by the framework integrations
+    in dogstatsd_collector.contrib. Raises RuntimeError if it has not been
+    configured with configure_collector_pool().
+    """
+    if _pool is None:
+        raise RuntimeError('Call configure_collector_pool() before using the DogStatsD collector pool')
+    return _pool
+
+
+def configure_collector_pool(dogstatsd, max_size=DEFAULT_MAX_POOL_SIZE, **collector_kwargs):
+    """
+    Replace the process-wide CollectorPool with one whose collectors emit to
+    dogstatsd. Takes the same arguments as CollectorPool.
+    """
+    global _pool
+    with _pool_lock:
+        _pool = CollectorPool(dogstatsd, max_size=max_size, **collector_kwargs)
+    return _pool
@@ -0,0 +1,202 @@
+import logging
+import os
+from collections import deque
+from struct import Struct
+from time import monotonic
+
+log = logging.getLogger(__name__)
+
+#: The default maximum number of payload bytes kept in memory.
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+#: The default maximum size, in bytes, of the spill file.
+DEFAULT_MAX_SPILL_BYTES = 16 * 1024 * 1024
+
+#: The default delay, in seconds, before the first retry after a failure.
+DEFAULT_INITIAL_BACKOFF = 0.1
+
+#: The default longest delay, in seconds, between retries.
+DEFAULT_MAX_BACKOFF = 30.0
+
+# Each payload in the spill file is prefixed with its length.
+_LENGTH = Struct('<I')
+
+
+class RetryBuffer(object):
+    """
+    A bounded buffer of payloads that could not be sent, for a
+    DatagramEmitter to retry once the agent is reachable again. At most
+    max_bytes of payloads are kept in memory; when it is full, the oldest
+    payloads are moved to a spill file, if spill_path is given, or dropped.
+    The spill file never grows past max_spill_bytes; payloads that do not
+    fit are dropped. The space of payloads read back from the spill file is
+    reclaimed as they are consumed. Payloads are retried oldest first, with
+    exponential backoff between failed attempts.
+
+    The emitter retries buffered payloads before it sends the next payload,
+    and whenever its replay() method is called; IntervalFlusher calls it on
+    every interval, so payloads are retried even when nothing new is sent.
+
+    :type max_bytes: int
+    :param max_bytes: The maximum number of payload bytes kept in memory.
+
+    :type spill_path: str
+    :param spill_path: If given, the path of a file to spill payloads to when
+                       memory is full. Use a different path per process.
+
+    :type max_spill_bytes: int
+    :param max_spill_bytes: The maximum size of the spill file.
+
+    :type initial_backoff: float
+    :param initial_backoff: The delay, in seconds, before the first retry
+                            after a failure. Doubles on every failed retry.
+
+    :type max_backoff: float
+    :param max_backoff: The longest delay, in seconds, between retries.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, spill_path=None, max_spill_bytes=DEFAULT_MAX_SPILL_BYTES,
+                 initial_backoff=DEFAULT_INITIAL_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self.max_spill_bytes = max_spill_bytes
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        #: The number of payloads dropped because the buffer was full.
+        self.dropped = 0
+        #: The number of payload bytes currently kept in memory.
+        self.bytes = 0
+        self._payloads = deque()
+        self._spill = None
+        # The spill file holds _spill_count payloads between _spill_offset
+        # and _spill_end.
+        self._spill_count = 0
+        self._spill_offset = 0
+        self._spill_end = 0
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+
+    def __len__(self):
+        return len(self._payloads) + self._spill_count
+
+    def add(self, payload):
+        """
+        Buffer a payload to be retried. Returns the number of payloads that
+        were dropped to make room for it.
+        """
+        dropped = 0
+        if len(payload) > self.max_bytes:
+            self.dropped += 1
+            return 1
+        self._payloads.append(payload)
+        self.bytes += len(payload)
+        while self.bytes > self.max_bytes:
+            oldest = self._payloads.popleft()
+            self.bytes -= len(oldest)
+            if not self._spill_payload(oldest):
+                dropped += 1
+        self.dropped += dropped
+        return dropped
+
+    def peek(self):
+        """
+        Return the oldest buffered payload, or None if the buffer is empty.
+        """
+        if self._spill_count:
+            self._spill.seek(self._spill_offset)
+            length, = _LENGTH.unpack(self._spill.read(_LENGTH.size))
+            return self._spill.read(length)
+        if self._payloads:
+            return self._payloads[0]
+        return None
+
+    def pop(self):
+        """
+        Remove the oldest buffered payload, once it has been sent.
+        """
+        if self._spill_count:
+            self._spill.seek(self._spill_offset)
+            length, = _LENGTH.unpack(self._spill.read(_LENGTH.size))
+            self._spill_offset += _LENGTH.size + length
+            self._spill_count -= 1
+            if not self._spill_count:
+                self._spill.truncate(0)
+                self._spill_offset = self._spill_end = 0
+            elif self._spill_offset >= self._spill_end - self._spill_offset:
+                # Once at least half of the file has been consumed, move the
+                # rest to the start, so each byte is moved O(1) times.
+                self._compact_spill()
+            return
+        self.bytes -= len(self._payloads.popleft())
+
+    def ready(self):
+        """
+        Return whether the backoff since the last failure has elapsed.
+        """
+        return monotonic() >= self._next_attempt
+
+    def failed(self):
+        """
+        Record a failed send, delaying the next retry.
+        """
+        if self._backoff:
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+        else:
+            self._backoff = self.initial_backoff
+        self._next_attempt = monotonic() + self._backoff
+
+    def succeeded(self):
+        """
+        Record a successful send, so the next failure starts a new backoff.
+        """
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+
+    def close(self):
+        """
+        Close and remove the spill file, dropping the payloads in it.
+        """
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            os.unlink(self.spill_path)
+            self._spill_count = self._spill_offset = self._spill_end = 0
+
+    def _compact_spill(self):
+        try:
+            self._spill.seek(self._spill_offset)
+            remaining = self._spill.read(self._spill_end - self._spill_offset)
+            self._spill.seek(0)
+            self._spill.write(remaining)
+            self._spill.truncate(len(remaining))
+            self._spill.flush()
+        except (IOError, OSError):
+            # The file may be half rewritten, so its payloads are lost.
+            log.warning('Error compacting DogStatsD spill file %s', self.spill_path, exc_info=True)
+            self.dropped += self._spill_count
+            self._spill_count = self._spill_offset = self._spill_end = 0
+            return
+        self._spill_offset = 0
+        self._spill_end = len(remaining)
+
+    def _spill_payload(self, payload):
+        if self.spill_path is None:
+            return False
+        size = _LENGTH.size + len(payload)
+        if self._spill_end + size > self.max_spill_bytes and self._spill_offset:
+            self._compact_spill()
+        if self._spill_end + size > self.max_spill_bytes:
+            return False
+        try:
+            if self._spill is None:
+                self._spill = open(self.spill_path, 'w+b')
+            self._spill.seek(self._spill_end)
+            self._spill.write(_LENGTH.pack(len(payload)))
+            self._spill.write(payload)
+            self._spill.flush()
+        except (IOError, OSError):
+            log.warning('Error spilling DogStatsD payload to %s', self.spill_path, exc_info=True)
+            return False
+        self._spill_end += size
+        self._spill_count += 1
+        return True
@@ -0,0 +1,69 @@
+from time import monotonic
+
+#: The default number of calls per interval above which a metric is sampled.
+DEFAULT_MAX_CALLS = 1000
+
+#: The default length, in seconds, of the interval calls are counted over.
+DEFAULT_INTERVAL = 1.0
+
+#: The default lowest sample rate an AdaptiveSampler will use.
+DEFAULT_MIN_RATE = 0.001
+
+
+class AdaptiveSampler(object):
+    """
+    Chooses a sample rate per metric from how often the metric is recorded.
+    Calls are counted per metric over an interval; for the next interval, a
+    metric that was recorded more than max_calls times is sampled at the rate
+    that would have kept max_calls of them, and every other metric is
+    recorded in full.
+
+    Pass one to DogstatsdCollector as adaptive_sampler. Recorded values are
+    scaled by the sample rate, so counter totals stay correct.
+
+    :type max_calls: int
+    :param max_calls: The number of calls per interval above which a metric
+                      is sampled.
+
+    :type interval: float
+    :param interval: The length, in seconds, of the interval calls are
+                     counted over.
+
+    :type min_rate: float
+    :param min_rate: The lowest sample rate to use.
+    """
+
+    def __init__(self, max_calls=DEFAULT_MAX_CALLS, interval=DEFAULT_INTERVAL, min_rate=DEFAULT_MIN_RATE):
+        self.max_calls = max_calls
+        self.interval = interval
+        self.min_rate = min_rate
+        self._counts = {}
+        self._rates = {}
+        self._interval_end = monotonic() + interval
+
+    def rate(self, metric):
+        """
+        Count a call for metric and return the rate it should be sampled at.
+        """
+        now = monotonic()
+        if now >= self._interval_end:
+            self._update_rates(now)
+        counts = self._counts
+        counts[metric] = counts.get(metric, 0) + 1
+        return self._rates.get(metric, 1.0)
+
+    @property
+    def rates(self):
+        """
+        The sample rates of the metrics currently being sampled.
+        """
+        return dict(self._rates)
+
+    def _update_rates(self, now):
+        rates = {}
+        for metric, calls in self._counts.items():
+            if calls > self.max_calls:
+                rates[metric] = max(float(self.max_calls) / calls, self.min_rate)
+        self._rates = rates
+        self._counts = {}
+        self._interval_end = now + self.interval
@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('dogstatsd_collector', default=None)
+
+
+def current_collector():
+    """
+    Return the collector of the innermost active collector_scope(), or None
+    outside of any scope.
+    """
+    return _current.get()
+
+
+@contextmanager
+def collector_scope(collector=None):
+    """
+    A context manager that makes a collector the current collector, used by
+    the module-level increment() and histogram() functions, until it exits.
+    The current collector is stored in a context variable, so every thread
+    and every asyncio task sees its own, and tasks inherit the collector that
+    was current when they were created.
+
+    If no collector is given, a child of the current collector is used, and
+    its series are merged into the parent when the scope exits. Use this to
+    give concurrent tasks separate collectors that still add up to one set
+    of series. A collector that has a parent is also merged into it on exit.
+
+    .. code-block:: python
+
+        with collector_scope(DogstatsdCollector(dogstatsd)) as metrics:
+            increment('request.count')
+            await asyncio.gather(*(handle(item) for item in items))
+        metrics.flush()
+
+        async def handle(item):
+            with collector_scope():
+                increment('item.count')
+
+    Yields the scope's collector.
+    """
+    if collector is None:
+        parent = _current.get()
+        if parent is None:
+            raise RuntimeError('collector_scope() needs a collector outside of any other scope')
+        collector = parent.child()
+    token = _current.set(collector)
+    try:
+        yield collector
+    finally:
+        _current.reset(token)
+        if collector.parent is not None:
+            collector.flush(reset=True)
+
+
+def increment(metric, value=1, tags=None, sample_rate=None):
+    """
+    Track a DogStatsD counter metric in the current collector. Does nothing
+    outside of a collector_scope().
+    """
+    collector = _current.get()
+    if collector is not None:
+        collector.increment(metric, value, tags, sample_rate)
+
+
+def histogram(metric, value, tags=None, sample_rate=None):
+    """
+    Track a DogStatsD histogram metric in the current collector. Does nothing
+    outside of a collector_scope().
+    """
+    collector = _current.get()
+    if collector is not None:
+        collector.histogram(metric, value, tags, sample_rate)
@@ -0,0 +1,228 @@
+import sys
+from array import array
+from struct import Struct
+from struct import error as struct_error
+
+from .histograms import HistogramStore
+from .histograms import QuantileSketch
+
+#: The first bytes of every snapshot.
+MAGIC = b'DSC'
+
+#: The version of the snapshot format written by dumps().
+VERSION = 2
+
+#: The metric types a snapshot may hold: those a collector records (see
+#: DogstatsdCollector.SUPPORTED_DOGSTATSD_METRICS).
+METRIC_TYPES = ('histogram', 'increment')
+
+# Every number is little-endian. A snapshot is laid out as:
+#
+#   header          magic, version
+#   string table    count, then (length, utf-8 bytes) per string
+#   tag set table   count, then (tag count, string index per tag) per tag set
+#   base tags       tag set index
+#   metric types    count, then per type:
+#                     type name string index, metric count, then per metric:
+#                       name string index, series count, then per series:
+#                         tag set index, kind, then a float value (VALUE) or
+#                         a serialized HistogramStore (STORE)
+_HEADER = Struct('<3sB')
+_COUNT = Struct('<I')
+_SERIES = Struct('<IB')
+_VALUE = Struct('<d')
+_STORE = Struct('<IIBd')
+_SKETCH = Struct('<dQdddQII')
+_BIN = Struct('<iQ')
+
+_VALUE_KIND = 0
+_STORE_KIND = 1
+
+_SWAP_BYTES = sys.byteorder != 'little'
+
+
+def dumps(containers, base_tags):
+    """
+    Serialize a collector's metric containers (a dict keyed by metric type,
+    as returned by DogstatsdCollector.swap()) and base tags to bytes.
+    """
+    strings = _Table()
+    tag_sets = _Table()
+    body = []
+    base_tags_index = tag_sets.index(tuple(strings.index(tag) for tag in base_tags))
+    body.append(_COUNT.pack(len(containers)))
+    for metric_type, container in containers.items():
+        metrics = [(metric, series) for metric, series in container.items() if series]
+        body.append(_COUNT.pack(strings.index(metric_type)))
+        body.append(_COUNT.pack(len(metrics)))
+        for metric, series in metrics:
+            body.append(_COUNT.pack(strings.index(metric)))
+            body.append(_COUNT.pack(len(series)))
+            for key, value in series.items():
+                tag_set = tag_sets.index(tuple(strings.index(tag) for tag in sorted(key)))
+                if isinstance(value, HistogramStore):
+                    body.append(_SERIES.pack(tag_set, _STORE_KIND))
+                    _dump_store(value, body)
+                else:
+                    body.append(_SERIES.pack(tag_set, _VALUE_KIND))
+                    body.append(_VALUE.pack(value))
+
+    parts = [_HEADER.pack(MAGIC, VERSION), _COUNT.pack(len(strings.values))]
+    for string in strings.values:
+        encoded = string.encode('utf-8')
+        parts.append(_COUNT.pack(len(encoded)))
+        parts.append(encoded)
+    parts.append(_COUNT.pack(len(tag_sets.values)))
+    for tag_set in tag_sets.values:
+        parts.append(_COUNT.pack(len(tag_set)))
+        parts.append(_array_bytes(array('I', tag_set)))
+    parts.append(_COUNT.pack(base_tags_index))
+    parts.extend(body)
+    return b''.join(parts)
+
+
+def loads(data):
+    """
+    Deserialize a snapshot written by dumps() from any bytes-like object
+    (bytes, bytearray, memoryview or mmap) and return a (base_tags,
+    containers) tuple. The snapshot is read in place without being copied;
+    containers are plain dicts, ready to merge into a collector.
+    Raises ValueError if data is not a snapshot of a supported version, or
+    is truncated or corrupt.
+    """
+    view = memoryview(data)
+    if view.format != 'B':
+        view = view.cast('B')
+    reader = _Reader(view)
+    magic, version = reader.unpack(_HEADER)
+    if magic != MAGIC:
+        raise ValueError('Not a dogstatsd_collector snapshot')
+    if version != VERSION:
+        raise ValueError('Unsupported snapshot version: {}'.format(version))
+    try:
+        return _load_body(reader)
+    except (IndexError, UnicodeDecodeError):
+        raise ValueError('Corrupt snapshot')
+
+
+def _load_body(reader):
+    strings = []
+    for _ in range(reader.count()):
+        strings.append(str(reader.take(reader.count()), 'utf-8'))
+    tag_sets = []
+    for _ in range(reader.count()):
+        tag_sets.append([strings[i] for i in reader.array('I', reader.count())])
+    base_tags = tag_sets[reader.count()]
+    keys = [frozenset(tags) for tags in tag_sets]
+
+    containers = {}
+    for _ in range(reader.count()):
+        metric_type = strings[reader.count()]
+        if metric_type not in METRIC_TYPES:
+            raise ValueError('Unknown metric type in snapshot: {}'.format(metric_type))
+        container = containers[metric_type] = {}
+        for _ in range(reader.count()):
+            series = container[strings[reader.count()]] = {}
+            for _ in range(reader.count()):
+                tag_set, kind = reader.unpack(_SERIES)
+                if kind == _VALUE_KIND:
+                    series[keys[tag_set]], = reader.unpack(_VALUE)
+                elif kind == _STORE_KIND and metric_type == 'histogram':
+                    series[keys[tag_set]] = _load_store(reader)
+                else:
+                    raise ValueError('Invalid series kind in snapshot for {}: {}'.format(metric_type, kind))
+    return base_tags, containers
+
+
+def _dump_store(store, body):
+    sketch = store.sketch
+    body.append(_STORE.pack(store.max_samples, len(store.samples), sketch is not None, store.weight))
+    body.append(_array_bytes(store.samples))
+    if sketch is not None:
+        body.append(_SKETCH.pack(
+            sketch.relative_accuracy, sketch.count, sketch.min, sketch.max, sketch.sum,
+            sketch.zero_count, len(sketch.positive), len(sketch.negative),
+        ))
+        for bins in (sketch.positive, sketch.negative):
+            for index, count in bins.items():
+                body.append(_BIN.pack(index, count))
+
+
+def _load_store(reader):
+    max_samples, sample_count, has_sketch, weight = reader.unpack(_STORE)
+    store = HistogramStore(max_samples)
+    store.weight = weight
+    store.samples = reader.array('d', sample_count)
+    if has_sketch:
+        (relative_accuracy, count, minimum, maximum, total, zero_count,
+         positive_count, negative_count) = reader.unpack(_SKETCH)
+        sketch = QuantileSketch(relative_accuracy)
+        sketch.count = count
+        sketch.min = minimum
+        sketch.max = maximum
+        sketch.sum = total
+        sketch.zero_count = zero_count
+        for bins, bin_count in ((sketch.positive, positive_count), (sketch.negative, negative_count)):
+            for _ in range(bin_count):
+                index, count = reader.unpack(_BIN)
+                bins[index] = count
+        store.sketch = sketch
+    return store
+
+
+def _array_bytes(values):
+    if _SWAP_BYTES:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class _Table(object):
+    # Assigns each distinct value the index of its first appearance.
+    __slots__ = ('indexes', 'values')
+
+    def __init__(self):
+        self.indexes = {}
+        self.values = []
+
+    def index(self, value):
+        try:
+            return self.indexes[value]
+        except KeyError:
+            index = self.indexes[value] = len(self.values)
+            self.values.append(value)
+            return index
+
+
+class _Reader(object):
+    __slots__ = ('view', 'offset')
+
+    def __init__(self, view):
+        self.view = view
+        self.offset = 0
+
+    def unpack(self, struct):
+        try:
+            values = struct.unpack_from(self.view, self.offset)
+        except struct_error:
+            raise ValueError('Truncated snapshot')
+        self.offset += struct.size
+        return values
+
+    def count(self):
+        return self.unpack(_COUNT)[0]
+
+    def take(self, size):
+        end = self.offset + size
+        if end > len(self.view):
+            raise ValueError('Truncated snapshot')
+        chunk = self.view[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def array(self, typecode, length):
+        values = array(typecode)
+        values.frombytes(self.take(length * values.itemsize))
+        if _SWAP_BYTES:
+            values.byteswap()
+        return values
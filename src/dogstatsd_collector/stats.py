@@ -0,0 +1,85 @@
+#: The prefix of the metrics a collector emits about itself.
+STATS_METRIC_PREFIX = 'dogstatsd_collector'
+
+
+class CollectorStats(object):
+    """
+    Counters describing what a collector costs: how often it is called, how
+    long its flushes take and how much they emit. Enable them by passing
+    collect_stats=True to DogstatsdCollector and read them from its stats
+    attribute, e.g. with as_dict().
+
+    Datagrams, bytes and dropped payloads are only counted when the collector
+    emits through a DatagramEmitter. Counters are not synchronized, so they
+    are approximate for a collector shared among threads.
+    """
+
+    #: The cumulative counters, in the order as_dict() returns them.
+    COUNTERS = (
+        'record_calls',
+        'flushes',
+        'datagrams',
+        'bytes',
+        'dropped_payloads',
+        'dropped_flushes',
+        'overflowed',
+        'partial_flushes',
+    )
+
+    __slots__ = COUNTERS + ('flush_time', 'last_flush_time', 'series', '_emitted')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Set every counter back to zero.
+        """
+        #: The number of values recorded through increment(), histogram() and
+        #: the bulk recording methods; values added through handles and
+        #: timers are not counted.
+        self.record_calls = 0
+        #: The number of flushes.
+        self.flushes = 0
+        #: The number of datagrams emitted.
+        self.datagrams = 0
+        #: The number of bytes emitted.
+        self.bytes = 0
+        #: The number of payloads that could not be sent.
+        self.dropped_payloads = 0
+        #: The number of background flushes dropped because the background
+        #: sender's queue was full.
+        self.dropped_flushes = 0
+        #: The number of values folded into an overflow series because a
+        #: series limit was reached.
+        self.overflowed = 0
+        #: The number of times the collector flushed early because it
+        #: reached its max_bytes.
+        self.partial_flushes = 0
+        #: The total wall time, in seconds, spent emitting flushes.
+        self.flush_time = 0.0
+        #: The wall time, in seconds, of the last flush.
+        self.last_flush_time = 0.0
+        #: The number of distinct series of each metric type in the last
+        #: flush.
+        self.series = {}
+        self._emitted = dict.fromkeys(self.COUNTERS, 0)
+
+    def as_dict(self):
+        """
+        Return the counters as a dict.
+        """
+        stats = dict((name, getattr(self, name)) for name in self.COUNTERS)
+        stats['flush_time'] = self.flush_time
+        stats['last_flush_time'] = self.last_flush_time
+        stats['series'] = dict(self.series)
+        return stats
+
+    def _take_deltas(self):
+        # The change in each counter since the last time they were emitted.
+        deltas = {}
+        for name in self.COUNTERS:
+            value = getattr(self, name)
+            deltas[name] = value - self._emitted[name]
+            self._emitted[name] = value
+        return deltas
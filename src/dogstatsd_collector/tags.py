@@ -0,0 +1,142 @@
+import threading
+from collections import OrderedDict
+
+#: The default maximum number of distinct tag sequences a TagInterner caches.
+#: Sized so that a collector with 100k series keeps them all cached.
+DEFAULT_MAX_SIZE = 131072
+
+#: The maximum number of interners, one per distinct list of base tags, kept
+#: by for_base_tags(). The least recently used one is dropped past this.
+MAX_SHARED_INTERNERS = 128
+
+_interners = OrderedDict()
+_interners_lock = threading.Lock()
+
+
+def serialize_tags(tags):
+    """
+    Serialize a list of tags as the tag suffix of a DogStatsD datagram line,
+    e.g. '|#tag1:value1,tag2:value2', or an empty string if there are no tags.
+    """
+    if not tags:
+        return ''
+    return '|#{}'.format(','.join(tags))
+
+
+def _evict_oldest(table):
+    # Another thread may be inserting or evicting at the same time, so the
+    # oldest entry may already be gone.
+    try:
+        table.pop(next(iter(table)), None)
+    except (StopIteration, RuntimeError):
+        pass
+
+
+class TagInterner(object):
+    """
+    An intern table mapping tag sequences to the canonical frozenset keys the
+    collector stores series under. For every key it also caches the sorted
+    list of tags with the base tags merged in, and that list serialized in
+    DogStatsD datagram format, so neither has to be built again at flush time.
+
+    Interners are shared between collectors with the same base tags; use
+    for_base_tags() to get one. Only the MAX_SHARED_INTERNERS most recently
+    used base tags keep a shared interner, so collectors created with
+    unbounded distinct base tags do not leak memory.
+
+    :type base_tags: list
+    :param base_tags: A list of tags to be merged into every tag set.
+
+    :type max_size: int
+    :param max_size: The maximum number of tag sequences to cache. Once the
+                     table is full, the oldest entry is evicted for each new
+                     one, so it stays bounded even when tags have unbounded
+                     cardinality.
+    """
+
+    def __init__(self, base_tags=None, max_size=DEFAULT_MAX_SIZE):
+        self.base_tags = list(base_tags or [])
+        self.max_size = max_size
+        self._keys = {}
+        self._canonical = {}
+        self._tags = {}
+        self._serialized = {}
+
+    @classmethod
+    def for_base_tags(cls, base_tags=None):
+        """
+        Return the process-wide interner for the given base tags.
+        """
+        base_tags = tuple(base_tags or ())
+        with _interners_lock:
+            interner = _interners.get(base_tags)
+            if interner is not None:
+                _interners.move_to_end(base_tags)
+                return interner
+            interner = _interners[base_tags] = cls(base_tags)
+            if len(_interners) > MAX_SHARED_INTERNERS:
+                _interners.popitem(last=False)
+            return interner
+
+    def key(self, tags):
+        """
+        Return the canonical key for a hashable sequence (usually a tuple) of
+        tags. Equal tag sets share the same key regardless of order.
+        """
+        try:
+            return self._keys[tags]
+        except KeyError:
+            return self._intern(tags)
+
+    def tags(self, key):
+        """
+        Return the sorted list of tags, including base tags, for a key.
+        """
+        try:
+            return self._tags[key]
+        except KeyError:
+            return self._cache(key)[0]
+
+    def serialized(self, key):
+        """
+        Return the DogStatsD datagram tag suffix, including base tags, for a
+        key.
+        """
+        try:
+            return self._serialized[key]
+        except KeyError:
+            return self._cache(key)[1]
+
+    def clear(self):
+        """
+        Drop every cached key and tag string.
+        """
+        self._keys.clear()
+        self._canonical.clear()
+        self._tags.clear()
+        self._serialized.clear()
+
+    def _intern(self, tags):
+        if len(self._keys) >= self.max_size:
+            _evict_oldest(self._keys)
+            _evict_oldest(self._canonical)
+        # Reuse the first frozenset seen for a tag set, so equal tag sets in
+        # any order are the same object.
+        key = frozenset(tags)
+        key = self._canonical.setdefault(key, key)
+        self._keys[tags] = key
+        return key
+
+    def _cache(self, key):
+        # Returns what it cached, since another thread may evict or clear
+        # it before the caller could read it back.
+        tags = list(key)
+        tags.extend(self.base_tags)
+        tags.sort()
+        serialized = serialize_tags(tags)
+        if len(self._tags) >= self.max_size:
+            _evict_oldest(self._tags)
+            _evict_oldest(self._serialized)
+        self._tags[key] = tags
+        self._serialized[key] = serialized
+        return tags, serialized
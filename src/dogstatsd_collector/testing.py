@@ -0,0 +1,235 @@
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from .aggregator import MAX_RECEIVE_SIZE
+from .aggregator import parse_line
+from .emitter import DatagramEmitter
+from .emitter import UnixDatagramEmitter
+
+log = logging.getLogger(__name__)
+
+#: The receive buffer size a FakeAgent asks for, so bursts of datagrams from
+#: many flushing collectors are not dropped while the listener catches up.
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class FakeAgent(object):
+    """
+    A stand-in DogStatsD agent for tests and benchmarks. Listens on a local
+    UDP port (or, if path is given, a Unix datagram socket) from a background
+    thread, counts every datagram it receives and aggregates the series they
+    contain, so tests can assert on exactly what went over the wire.
+
+    .. code-block:: python
+
+        with FakeAgent() as agent:
+            collector = DogstatsdCollector(agent.emitter())
+            collector.increment('my.metric', tags=['a:1'])
+            collector.flush()
+            agent.wait_for(datagrams=1)
+            assert agent.counter('my.metric', ['a:1']) == 1
+
+    :type host: str
+    :param host: The host to listen on, for UDP.
+
+    :type port: int
+    :param port: The port to listen on, for UDP. By default a free port is
+                 picked; see the port attribute.
+
+    :type path: str
+    :param path: If given, listen on a Unix datagram socket at this path
+                 instead of on UDP.
+
+    :type parse: bool
+    :param parse: If False, only count datagrams and bytes without parsing
+                  them, to measure raw throughput.
+
+    :type keep_payloads: bool
+    :param keep_payloads: If True, keep every datagram received, in order, in
+                          the payloads attribute, to assert on exactly how
+                          series were packed.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, path=None, parse=True, keep_payloads=False):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.parse = parse
+        self.keep_payloads = keep_payloads
+        self._lock = threading.Lock()
+        self._socket = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self.reset()
+
+    def start(self):
+        """
+        Bind the socket and start receiving datagrams in a background thread.
+        """
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+            sock.bind(self.path)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+            sock.bind((self.host, self.port))
+            self.host, self.port = sock.getsockname()
+        # Wake up regularly to notice stop().
+        sock.settimeout(0.1)
+        self._socket = sock
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='dogstatsd-collector-fake-agent')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop receiving datagrams and close the socket.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            if self.path is not None:
+                os.unlink(self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def emitter(self, **kwargs):
+        """
+        Return an emitter that sends to this agent. Keyword arguments are
+        passed to the emitter.
+        """
+        if self.path is not None:
+            return UnixDatagramEmitter(self.path, **kwargs)
+        return DatagramEmitter(host=self.host, port=self.port, **kwargs)
+
+    def reset(self):
+        """
+        Forget every datagram and series received so far.
+        """
+        with self._lock:
+            #: The number of datagrams received.
+            self.datagrams = 0
+            #: The number of bytes received.
+            self.bytes = 0
+            #: The received lines that could not be parsed.
+            self.malformed = []
+            #: The largest datagram received, in bytes.
+            self.max_datagram_size = 0
+            #: The datagrams received, in order, if keep_payloads is True.
+            self.payloads = []
+            self._counters = defaultdict(float)
+            self._histograms = defaultdict(list)
+            self._first_received = None
+            self._last_received = None
+
+    def wait_for(self, datagrams, timeout=5):
+        """
+        Wait until at least the given number of datagrams have been received.
+        Returns False if they were not received within timeout seconds.
+        """
+        deadline = time.time() + timeout
+        while self.datagrams < datagrams:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def counter(self, metric, tags=None):
+        """
+        Return the total of the counter series with the given tags, in any
+        order, or 0 if none was received.
+        """
+        with self._lock:
+            return self._counters.get(self._series_key(metric, tags), 0)
+
+    def histogram_values(self, metric, tags=None):
+        """
+        Return the list of values received for the histogram series with the
+        given tags, in any order.
+        """
+        with self._lock:
+            return list(self._histograms.get(self._series_key(metric, tags), ()))
+
+    def series(self):
+        """
+        Return a dict mapping (metric_type, metric, sorted tags tuple) to the
+        counter total or list of histogram values received for each series.
+        """
+        with self._lock:
+            series = dict(
+                (('increment',) + key, value) for key, value in self._counters.items()
+            )
+            series.update(
+                (('histogram',) + key, list(values)) for key, values in self._histograms.items()
+            )
+        return series
+
+    def rate(self):
+        """
+        Return the number of datagrams received per second, between the first
+        and the last datagram received since the last reset.
+        """
+        with self._lock:
+            if self._first_received is None or self._last_received == self._first_received:
+                return 0.0
+            return self.datagrams / (self._last_received - self._first_received)
+
+    def _series_key(self, metric, tags):
+        return metric, tuple(sorted(tags)) if tags else ()
+
+    def _run(self):
+        sock = self._socket
+        while not self._stopped.is_set():
+            try:
+                payload = sock.recv(MAX_RECEIVE_SIZE)
+            except socket.timeout:
+                continue
+            except socket.error:
+                log.warning('Error receiving DogStatsD payload', exc_info=True)
+                continue
+            self._handle_payload(payload)
+
+    def _handle_payload(self, payload):
+        now = time.time()
+        with self._lock:
+            if self._first_received is None:
+                self._first_received = now
+            self._last_received = now
+            self.datagrams += 1
+            self.bytes += len(payload)
+            if len(payload) > self.max_datagram_size:
+                self.max_datagram_size = len(payload)
+            if self.keep_payloads:
+                self.payloads.append(payload)
+            if not self.parse:
+                return
+            for line in payload.split(b'\n'):
+                if not line:
+                    continue
+                try:
+                    metric_type, metric, value, tags = parse_line(line)
+                except ValueError:
+                    self.malformed.append(line)
+                    continue
+                key = self._series_key(metric, tags)
+                if metric_type == 'histogram':
+                    self._histograms[key].append(value)
+                else:
+                    self._counters[key] += value
@@ -0,0 +1,291 @@
+import threading
+import weakref
+from collections import defaultdict
+from random import random
+
+from .background import get_background_sender
+from .base import DogstatsdCollector
+from .base import _new_series
+from .handles import ShardedSeriesHandle
+from .histograms import HistogramStore
+
+
+def _new_containers(metric_types):
+    return dict(
+        (metric_type, defaultdict(_new_series))
+        for metric_type in metric_types
+    )
+
+
+class _Shard(object):
+    __slots__ = ('containers', 'pending', 'started', 'finished', 'dead')
+
+    def __init__(self, metric_types):
+        self.containers = _new_containers(metric_types)
+        # The containers swapped out by flush(reset=True) that the owning
+        # thread may still be writing to, each with the number of writes
+        # started when it was swapped out.
+        self.pending = []
+        # The number of writes the owning thread has started and finished.
+        # Writes are sequential, so once finished reaches the number started
+        # when containers were swapped out, no write into them is left.
+        self.started = 0
+        self.finished = 0
+        # Set once the owning thread has exited.
+        self.dead = False
+
+
+class _ThreadSentinel(object):
+    # Kept in the owning thread's threading.local, so it is garbage
+    # collected when the thread exits.
+    __slots__ = ('__weakref__',)
+
+
+def _mark_dead(shard):
+    shard.dead = True
+
+
+class ThreadedDogstatsdCollector(DogstatsdCollector):
+    """
+    A DogstatsdCollector that can be shared among multiple threads. Each
+    thread records into its own shard of metric containers, so recording
+    never takes a lock; flush() merges the shards into a single set of series.
+
+    Shards are only ever written to by the thread that owns them.
+    flush(reset=True) swaps new containers into every shard that has
+    recorded anything, so its cost scales with the series recorded since the
+    last flush rather than with every series ever seen. The previous
+    containers are emitted once the owning thread has finished every write
+    it started before the swap; a write still in progress during the flush
+    delays them to the next flush, so no values are lost. The shard of a
+    thread that has exited is folded into the next flush(reset=True) and
+    then dropped.
+
+    Other keyword arguments are passed to DogstatsdCollector. Series limits
+    and max_bytes apply to each thread's shard.
+    """
+
+    def __init__(self, dogstatsd, base_tags=None, **kwargs):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        super(ThreadedDogstatsdCollector, self).__init__(dogstatsd, base_tags=base_tags, **kwargs)
+
+    def increment(self, metric, value=1, tags=None, sample_rate=None):
+        """
+        Track a DogStatsD counter metric in the current thread's shard. See
+        DogstatsdCollector.increment().
+        """
+        if sample_rate is not None or self.adaptive_sampler is not None:
+            sample_rate = self._get_sample_rate(metric, sample_rate)
+            if sample_rate < 1.0:
+                if random() >= sample_rate:
+                    return
+                value = value / sample_rate
+        self._record('increment', metric, value, tags)
+
+    def histogram(self, metric, value, tags=None, sample_rate=None):
+        """
+        Track a DogStatsD histogram metric in the current thread's shard. See
+        DogstatsdCollector.histogram().
+        """
+        weight = 1
+        if sample_rate is not None or self.adaptive_sampler is not None:
+            sample_rate = self._get_sample_rate(metric, sample_rate)
+            if sample_rate < 1.0:
+                if random() >= sample_rate:
+                    return
+                if metric in self._stored_histograms:
+                    weight = 1 / sample_rate
+                else:
+                    value = value / sample_rate
+        self._record('histogram', metric, value, tags, weight)
+
+    def counter(self, metric, tags=None):
+        """
+        Return a handle bound to a counter series, whose add() method
+        increments it in the calling thread's shard. See
+        DogstatsdCollector.counter().
+        """
+        return self._get_handle('increment', metric, tags)
+
+    def histogram_handle(self, metric, tags=None):
+        """
+        Return a handle bound to a histogram series, whose add() method
+        records a value in the calling thread's shard. See counter().
+        """
+        return self._get_handle('histogram', metric, tags)
+
+    def flush(self, reset=False, background=False):
+        """
+        Merge the shards of every thread and flush all metrics, emitting each
+        metric once per series (combination of tag key-value pairs).
+
+        :type reset: bool
+        :param reset: If True, series emitted by this flush are not emitted
+                      again by the next flush.
+
+        :type background: bool
+        :param background: See DogstatsdCollector.flush(). The shards are
+                           merged on the flushing thread.
+        """
+        if background:
+            get_background_sender().submit(self, self.swap())
+            return
+        self._emit(self._merge_shards(reset))
+
+    def swap(self):
+        """
+        Merge the shards of every thread and return the merged containers as
+        a dict keyed by metric type, as if the collector had been reset. Unlike
+        DogstatsdCollector.swap(), this is O(n) in the number of series.
+        """
+        return self._merge_shards(reset=True)
+
+    def reset(self):
+        """
+        Drop every series collected so far by every thread, and the cached
+        timers. Values recorded by other threads while resetting may be lost.
+        """
+        with self._shards_lock:
+            shards = list(self._shards)
+        with self._flush_lock:
+            for shard in shards:
+                shard.containers = _new_containers(self.SUPPORTED_DOGSTATSD_METRICS)
+                shard.pending = []
+            self._drop_dead_shards()
+            self._init_containers()
+            self.capped_metrics.clear()
+            self._timers.clear()
+
+    def _record(self, metric_type, metric, value, tags, weight=1):
+        shard = self._get_shard()
+        shard.started += 1
+        try:
+            container = shard.containers[metric_type]
+            if metric_type == 'histogram' and metric in self._stored_histograms:
+                self._record_histogram_value(container, metric, value, tags, weight)
+            else:
+                self._record_metric(container, metric, value, tags)
+        finally:
+            shard.finished += 1
+
+    def _record_many(self, metric_type, metrics, values, tags):
+        shard = self._get_shard()
+        shard.started += 1
+        try:
+            super(ThreadedDogstatsdCollector, self)._record_many(metric_type, metrics, values, tags)
+        finally:
+            shard.finished += 1
+
+    def _merge_containers(self, containers, base_tags):
+        # Merges into the calling thread's shard, so count it as a write.
+        shard = self._get_shard()
+        shard.started += 1
+        try:
+            super(ThreadedDogstatsdCollector, self)._merge_containers(containers, base_tags)
+        finally:
+            shard.finished += 1
+
+    def _merge_shards(self, reset):
+        merged = _new_containers(self.SUPPORTED_DOGSTATSD_METRICS)
+        with self._shards_lock:
+            shards = list(self._shards)
+        with self._flush_lock:
+            if reset:
+                self._init_containers()
+            for shard in shards:
+                if reset:
+                    self._swap_shard(shard, merged)
+                else:
+                    self._copy_shard(shard, merged)
+            if reset:
+                self._drop_dead_shards()
+        return merged
+
+    def _swap_shard(self, shard, merged):
+        containers = shard.containers
+        if any(containers.values()):
+            shard.containers = _new_containers(self.SUPPORTED_DOGSTATSD_METRICS)
+            # Read after the swap: any write into the previous containers
+            # has been started by now.
+            shard.pending.append((containers, shard.started))
+        if not shard.pending:
+            return
+        finished = shard.finished
+        pending = []
+        for containers, started in shard.pending:
+            if finished >= started:
+                self._merge_into(merged, containers, copy=False)
+            else:
+                # The owning thread is still writing into these containers.
+                pending.append((containers, started))
+        shard.pending = pending
+
+    def _drop_dead_shards(self):
+        # A dead shard is never written to again, so once its containers have
+        # been swapped out and emitted there is nothing left in it.
+        with self._shards_lock:
+            self._shards = [
+                shard for shard in self._shards
+                if not shard.dead or shard.pending or any(shard.containers.values())
+            ]
+
+    def _copy_shard(self, shard, merged):
+        # The owning thread may be writing while we read, so copy everything.
+        for containers, started in list(shard.pending):
+            self._merge_into(merged, containers, copy=True)
+        self._merge_into(merged, shard.containers, copy=True)
+
+    def _merge_into(self, merged, containers, copy):
+        for metric_type in self.SUPPORTED_DOGSTATSD_METRICS:
+            target = merged[metric_type]
+            # The owning thread may be adding series while we read, so
+            # iterate over copies.
+            for metric, series in list(containers[metric_type].items()):
+                mine = target[metric]
+                for key, value in list(series.items()):
+                    if isinstance(value, HistogramStore):
+                        store = mine.get(key)
+                        if store is None and not copy:
+                            mine[key] = value
+                            continue
+                        if store is None:
+                            store = mine[key] = HistogramStore(value.max_samples)
+                        store.merge(value)
+                    else:
+                        mine[key] += value
+
+    def _get_handle(self, metric_type, metric, tags):
+        # Handles record through the calling thread's shard, so unlike the
+        # base class there is nothing to fold in at flush time and they are
+        # not kept.
+        return ShardedSeriesHandle(self, metric_type, metric, tuple(tags) if tags else None)
+
+    def _init_containers(self):
+        # Containers live in the per-thread shards instead of on the
+        # collector; only the series limit counters are reset.
+        self._series_count = 0
+        self._bytes = 0
+
+    def _get_metric_containers(self):
+        return self._merge_shards(reset=False)
+
+    def _get_metric_container(self, metric_type):
+        return self._get_shard().containers[metric_type]
+
+    def _get_shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._new_shard()
+            sentinel = self._local.sentinel = _ThreadSentinel()
+            weakref.finalize(sentinel, _mark_dead, shard)
+            return shard
+
+    def _new_shard(self):
+        shard = _Shard(self.SUPPORTED_DOGSTATSD_METRICS)
+        with self._shards_lock:
+            self._shards.append(shard)
+        return shard
@@ -0,0 +1,63 @@
+from asyncio import iscoroutinefunction
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter_ns
+
+# The start times of the timed blocks entered in the current context, as a
+# stack of (start, parent) tuples. asyncio tasks and threads each run in
+# their own context, so timed blocks that overlap without nesting, in
+# different tasks or threads, never pop each other's start time.
+_starts = ContextVar('dogstatsd_collector_timer_starts', default=None)
+
+
+class Timer(object):
+    """
+    Times blocks of code or function calls and records the durations in a
+    histogram series. Works as a context manager and as a decorator, and can
+    be entered repeatedly (and re-entrantly) without allocating a new timer.
+    A timer can be shared between threads and asyncio tasks: the start time
+    of each timed block is kept in the current context, not on the timer.
+    Decorating a coroutine function times each call until its coroutine
+    completes, not just until it is created.
+
+    Get one from DogstatsdCollector.timed().
+    """
+
+    __slots__ = ('_add', '_scale')
+
+    def __init__(self, handle, use_ms=False):
+        self._add = handle.add
+        self._scale = 1e-6 if use_ms else 1e-9
+
+    def __enter__(self):
+        _starts.set((perf_counter_ns(), _starts.get()))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = perf_counter_ns()
+        start, parent = _starts.get()
+        _starts.set(parent)
+        self._add((end - start) * self._scale)
+
+    def __call__(self, func):
+        add = self._add
+        scale = self._scale
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def timed_coroutine(*args, **kwargs):
+                start = perf_counter_ns()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    add((perf_counter_ns() - start) * scale)
+            return timed_coroutine
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add((perf_counter_ns() - start) * scale)
+        return timed
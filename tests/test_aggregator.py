@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.aggregator import Aggregator
+from dogstatsd_collector.aggregator import AggregatorEmitter
+from dogstatsd_collector.aggregator import parse_line
+from dogstatsd_collector.testing import FakeAgent
+
+
+class ParseLineTests(TestCase):
+    def test_counter_without_tags(self):
+        self.assertEqual(parse_line(b'my.metric:2.0|c'), ('increment', 'my.metric', 2.0, []))
+
+    def test_histogram_with_tags(self):
+        self.assertEqual(
+            parse_line('my.time:0.5|h|#a:1,b:2'),
+            ('histogram', 'my.time', 0.5, ['a:1', 'b:2']),
+        )
+
+    def test_unsupported_type(self):
+        with self.assertRaises(ValueError):
+            parse_line('my.gauge:1|g')
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            parse_line('garbage')
+
+    def test_invalid_sample_rate(self):
+        for line in ('my.metric:1|c|@0', 'my.metric:1|c|@-0.5', 'my.time:1|h|@2', 'my.metric:1|c|@x'):
+            with self.assertRaises(ValueError):
+                parse_line(line)
+
+
+class AggregatorTests(TestCase):
+    def setUp(self):
+        super(AggregatorTests, self).setUp()
+        self.agent = FakeAgent(keep_payloads=True).start()
+        self.addCleanup(self.agent.stop)
+        self.emitter = self.agent.emitter()
+        self.addCleanup(self.emitter.close)
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'aggregator.sock')
+        self.aggregator = Aggregator(self.emitter, self.path, interval=60)
+
+    def recv_payloads(self):
+        self.assertTrue(self.agent.wait_for(self.emitter.datagrams_sent))
+        return self.agent.payloads
+
+    def test_handle_payload_sums_counters_and_keeps_histograms(self):
+        self.aggregator.handle_payload(b'my.metric:1.0|c|#a:1\nmy.time:0.5|h')
+        self.aggregator.handle_payload(b'my.metric:2.0|c|#a:1\nmy.time:0.5|h\n')
+        self.aggregator.flush()
+        self.assertEqual(self.recv_payloads(), [b'my.metric:3.0|c|#a:1\nmy.time:0.5|h\nmy.time:0.5|h'])
+
+    def test_handle_payload_drops_invalid_sample_rate(self):
+        self.aggregator.handle_payload(b'my.metric:1.0|c|@0\nmy.metric:2.0|c')
+        self.aggregator.flush()
+        self.assertEqual(self.recv_payloads(), [b'my.metric:2.0|c'])
+
+    def test_histogram_lines_are_sent_once_they_fill_a_payload(self):
+        self.emitter.max_payload_size = 24
+        for i in range(10):
+            self.aggregator.handle_payload('my.time:{}|h'.format(i).encode('utf-8'))
+        # Two 11-byte lines fill a payload, so each pair is sent as soon as
+        # the next line arrives.
+        self.assertEqual(self.aggregator._histogram_lines, ['my.time:8|h', 'my.time:9|h'])
+        self.assertEqual(self.emitter.datagrams_sent, 4)
+        self.aggregator.flush()
+        payloads = self.recv_payloads()
+        self.assertEqual(len(payloads), 5)
+        self.assertEqual(payloads[0], b'my.time:0|h\nmy.time:1|h')
+        self.assertEqual(b'\n'.join(payloads).split(b'\n'), [
+            'my.time:{}|h'.format(i).encode('utf-8') for i in range(10)
+        ])
+
+    def test_flush_resets(self):
+        self.aggregator.handle_payload(b'my.metric:1.0|c')
+        self.aggregator.flush()
+        self.aggregator.flush()
+        self.assertEqual(self.recv_payloads(), [b'my.metric:1.0|c'])
+
+    def test_workers_are_combined(self):
+        self.aggregator.start()
+        for worker in range(4):
+            worker_emitter = AggregatorEmitter(self.path)
+            collector = DogstatsdCollector(worker_emitter, base_tags=['host:a'])
+            for i in range(10):
+                collector.increment('my.metric', tags=['tag:{}'.format(i)])
+            collector.flush()
+            worker_emitter.close()
+        self.aggregator.stop()
+
+        payloads = self.recv_payloads()
+        self.assertEqual(len(payloads), 1)
+        lines = payloads[0].split(b'\n')
+        self.assertEqual(len(lines), 10)
+        self.assertIn(b'my.metric:4.0|c|#host:a,tag:0', lines)
+        self.assertFalse(os.path.exists(self.path))
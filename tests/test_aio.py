@@ -0,0 +1,80 @@
+import asyncio
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import call
+
+from dogstatsd_collector import AsyncDatagramEmitter
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.testing import FakeAgent
+
+
+class AsyncDatagramEmitterTests(TestCase):
+    def setUp(self):
+        super(AsyncDatagramEmitterTests, self).setUp()
+        self.agent = FakeAgent(keep_payloads=True).start()
+        self.addCleanup(self.agent.stop)
+        self.emitter = AsyncDatagramEmitter(host=self.agent.host, port=self.agent.port)
+        self.addCleanup(self.emitter.close)
+        self.collector = DogstatsdCollector(self.emitter)
+
+    def recv_lines(self):
+        self.assertTrue(self.agent.wait_for(self.emitter.datagrams_sent))
+        return b'\n'.join(self.agent.payloads).split(b'\n') if self.agent.payloads else []
+
+    def test_aflush_sends_series(self):
+        self.collector.increment('my.metric', tags=['tag1:value1'])
+        self.collector.histogram('my.time', 0.5)
+        asyncio.run(self.collector.aflush())
+        self.assertEqual(sorted(self.recv_lines()), [
+            b'my.metric:1.0|c|#tag1:value1',
+            b'my.time:0.5|h',
+        ])
+
+    def test_aflush_reuses_transport(self):
+        async def flush_twice():
+            self.collector.increment('my.metric')
+            await self.collector.aflush(reset=True)
+            transport = self.emitter._transport
+            self.collector.increment('my.metric')
+            await self.collector.aflush(reset=True)
+            return transport is self.emitter._transport
+
+        self.assertTrue(asyncio.run(flush_twice()))
+        self.assertEqual(self.recv_lines(), [b'my.metric:1.0|c', b'my.metric:1.0|c'])
+
+    def test_aflush_with_reset(self):
+        self.collector.increment('my.metric')
+        asyncio.run(self.collector.aflush(reset=True))
+        self.assertEqual(self.collector._increments, {})
+
+    def test_aflush_waits_while_paused(self):
+        async def flush_paused():
+            self.collector.increment('my.metric')
+            await self.collector.aflush(reset=True)
+            self.emitter._protocol.pause_writing()
+            self.collector.increment('my.metric')
+            flush = asyncio.ensure_future(self.collector.aflush(reset=True))
+            await asyncio.sleep(0.05)
+            done_while_paused = flush.done()
+            self.emitter._protocol.resume_writing()
+            await flush
+            return done_while_paused
+
+        self.assertFalse(asyncio.run(flush_paused()))
+        self.assertEqual(len(self.recv_lines()), 2)
+
+    def test_aflush_many_series_in_few_payloads(self):
+        for i in range(1000):
+            self.collector.increment('my.metric', tags=['tag:{}'.format(i)])
+        asyncio.run(self.collector.aflush())
+        self.assertEqual(len(self.recv_lines()), 1000)
+
+
+class AflushWithDogStatsdTests(TestCase):
+    def test_aflush_falls_back_to_flush(self):
+        dogstatsd = MagicMock()
+        collector = DogstatsdCollector(dogstatsd)
+        collector.increment('my.metric')
+        asyncio.run(collector.aflush())
+        dogstatsd.increment.assert_has_calls([call('my.metric', 1, tags=[])])
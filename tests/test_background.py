@@ -0,0 +1,96 @@
+import threading
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import call
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.background import BLOCK
+from dogstatsd_collector.background import DROP_NEWEST
+from dogstatsd_collector.background import DROP_OLDEST
+from dogstatsd_collector.background import BackgroundSender
+from dogstatsd_collector.background import get_background_sender
+
+
+class BlockingCollector(object):
+    """
+    Stands in for a collector whose emission blocks until released.
+    """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.emitted = []
+
+    def _emit(self, containers):
+        self.started.set()
+        self.release.wait(5)
+        self.emitted.append(containers)
+
+
+class BackgroundSenderTests(TestCase):
+    def make_sender(self, policy):
+        sender = BackgroundSender(max_queue_size=2, policy=policy)
+        self.addCleanup(sender.stop)
+        collector = BlockingCollector()
+        self.addCleanup(collector.release.set)
+        # Occupy the sender thread so that later snapshots stay queued.
+        sender.submit(collector, 'busy')
+        collector.started.wait(5)
+        return sender, collector
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            BackgroundSender(policy='nope')
+
+    def test_drop_oldest(self):
+        sender, collector = self.make_sender(DROP_OLDEST)
+        for snapshot in ['a', 'b', 'c']:
+            self.assertTrue(sender.submit(collector, snapshot))
+        collector.release.set()
+        sender.drain()
+        self.assertEqual(collector.emitted, ['busy', 'b', 'c'])
+        self.assertEqual(sender.dropped, 1)
+        self.assertEqual(sender.sent, 3)
+
+    def test_drop_newest(self):
+        sender, collector = self.make_sender(DROP_NEWEST)
+        results = [sender.submit(collector, snapshot) for snapshot in ['a', 'b', 'c']]
+        collector.release.set()
+        sender.drain()
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(collector.emitted, ['busy', 'a', 'b'])
+        self.assertEqual(sender.dropped, 1)
+
+    def test_block(self):
+        sender, collector = self.make_sender(BLOCK)
+        sender.submit(collector, 'a')
+        sender.submit(collector, 'b')
+        blocked = threading.Thread(target=sender.submit, args=(collector, 'c'))
+        blocked.start()
+        blocked.join(0.05)
+        self.assertTrue(blocked.is_alive())
+        collector.release.set()
+        blocked.join(5)
+        sender.drain()
+        self.assertEqual(collector.emitted, ['busy', 'a', 'b', 'c'])
+        self.assertEqual(sender.dropped, 0)
+
+    def test_stop_sends_queued_snapshots(self):
+        sender, collector = self.make_sender(DROP_OLDEST)
+        sender.submit(collector, 'a')
+        collector.release.set()
+        sender.stop()
+        self.assertEqual(collector.emitted, ['busy', 'a'])
+        self.assertIsNone(sender._thread)
+
+
+class BackgroundFlushTests(TestCase):
+    def test_flush_in_background(self):
+        dogstatsd = MagicMock()
+        collector = DogstatsdCollector(dogstatsd)
+        collector.increment('my.metric', tags=['tag1:value1'])
+        collector.flush(background=True)
+        self.assertEqual(collector._increments, {})
+        get_background_sender().drain()
+        dogstatsd.increment.assert_has_calls([call('my.metric', 1, tags=['tag1:value1'])])
@@ -1,10 +1,16 @@
 from unittest import TestCase
+from unittest import skipIf
 
 from mock import MagicMock
 from mock import call
 
 from dogstatsd_collector import DogstatsdCollector
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class DogstatsdCollectorTests(TestCase):
     def setUp(self):
@@ -412,3 +418,390 @@ class DogstatsdCollectorTests(TestCase):
             call(metric_name, 2, tags=['tag1:value1', 'tag2:value2']),
             call(metric_name, 3, tags=['tag1:value1', 'tag2:value2', 'tag3:value3']),
         ], any_order=True)
+
+    def test_flush_without_reset_keeps_series(self):
+        metric_name = 'my.metric'
+        self.collector.increment(metric_name)
+        self.collector.flush()
+        self.collector.flush()
+        self.assertEqual(self.dogstatsd.increment.call_count, 2)
+
+    def test_flush_with_reset_clears_series(self):
+        metric_name = 'my.metric'
+        self.collector.increment(metric_name)
+        self.collector.flush(reset=True)
+        self.assertEqual(self.collector._increments, {})
+        self.collector.flush(reset=True)
+        self.dogstatsd.increment.assert_called_once_with(metric_name, 1, tags=[])
+
+    def test_flush_with_reset_emits_only_new_series(self):
+        metric_name = 'my.metric'
+        self.collector.increment(metric_name, tags=['tag1:value1'])
+        self.collector.flush(reset=True)
+        self.collector.increment(metric_name, tags=['tag1:value2'])
+        self.collector.flush(reset=True)
+        self.dogstatsd.increment.assert_has_calls([
+            call(metric_name, 1, tags=['tag1:value1']),
+            call(metric_name, 1, tags=['tag1:value2']),
+        ])
+        self.assertEqual(self.dogstatsd.increment.call_count, 2)
+
+    def test_swap_returns_previous_containers(self):
+        self.collector.increment('my.metric')
+        self.collector.histogram('my.time', 0.5)
+        increments = self.collector._increments
+        histograms = self.collector._histograms
+
+        containers = self.collector.swap()
+
+        self.assertIs(containers['increment'], increments)
+        self.assertIs(containers['histogram'], histograms)
+        self.assertEqual(self.collector._increments, {})
+        self.assertEqual(self.collector._histograms, {})
+
+    def test_record_after_swap_goes_to_new_containers(self):
+        containers = self.collector.swap()
+        self.collector.increment('my.metric')
+        self.assertEqual(containers['increment'], {})
+        self.assertEqual(self.collector._increments['my.metric'][frozenset()], 1)
+
+    def test_ctor_rejects_unknown_histogram_mode(self):
+        with self.assertRaises(ValueError):
+            DogstatsdCollector(self.dogstatsd, histogram_modes={'my.metric': 'nope'})
+
+    def test_histogram_sum_mode(self):
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.metric': 'sum'})
+        collector.histogram('my.metric', 1)
+        collector.histogram('my.metric', 2)
+        collector.flush()
+        self.dogstatsd.histogram.assert_called_once_with('my.metric', 3, tags=[])
+
+    def test_histogram_samples_mode(self):
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.metric': 'samples'})
+        collector.histogram('my.metric', 1, tags=['tag1:value1'])
+        collector.histogram('my.metric', 2, tags=['tag1:value1'])
+        collector.histogram('my.other', 1)
+        collector.histogram('my.other', 2)
+        collector.flush()
+        self.dogstatsd.histogram.assert_has_calls([
+            call('my.metric', 1, tags=['tag1:value1']),
+            call('my.metric', 2, tags=['tag1:value1']),
+            call('my.other', 3, tags=[]),
+        ], any_order=True)
+        self.assertEqual(self.dogstatsd.histogram.call_count, 3)
+
+    def test_histogram_samples_mode_is_bounded(self):
+        collector = DogstatsdCollector(
+            self.dogstatsd, histogram_modes={'my.metric': 'samples'}, max_histogram_samples=10
+        )
+        for i in range(1000):
+            collector.histogram('my.metric', i)
+        collector.flush()
+        self.assertEqual(self.dogstatsd.histogram.call_count, 10)
+        # DogStatsD clients drop values themselves when given a sample rate.
+        for args, kwargs in self.dogstatsd.histogram.call_args_list:
+            self.assertNotIn('sample_rate', kwargs)
+
+    def test_histogram_summary_mode(self):
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.metric': 'summary'})
+        for i in range(1, 101):
+            collector.histogram('my.metric', i, tags=['tag1:value1'])
+        collector.flush()
+        tags = ['tag1:value1']
+        self.dogstatsd.increment.assert_called_once_with('my.metric.count', 100, tags=tags)
+        self.dogstatsd.histogram.assert_has_calls([
+            call('my.metric.min', 1, tags=tags),
+            call('my.metric.max', 100, tags=tags),
+            call('my.metric.avg', 50.5, tags=tags),
+            call('my.metric.p50', 51, tags=tags),
+            call('my.metric.p95', 95, tags=tags),
+            call('my.metric.p99', 99, tags=tags),
+        ], any_order=True)
+
+    def test_max_series_per_metric(self):
+        collector = DogstatsdCollector(self.dogstatsd, max_series_per_metric=2)
+        for i in range(5):
+            collector.increment('my.metric', tags=['user:{}'.format(i)])
+        collector.increment('my.metric', tags=['user:0'])
+        collector.increment('my.other', tags=['user:0'])
+        collector.flush()
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 2, tags=['user:0']),
+            call('my.metric', 1, tags=['user:1']),
+            call('my.metric', 3, tags=['overflow:true']),
+            call('my.other', 1, tags=['user:0']),
+        ], any_order=True)
+        self.assertEqual(self.dogstatsd.increment.call_count, 4)
+        self.assertEqual(collector.capped_metrics, set(['my.metric']))
+
+    def test_max_series(self):
+        collector = DogstatsdCollector(self.dogstatsd, max_series=2)
+        collector.increment('my.metric', tags=['user:0'])
+        collector.histogram('my.time', 1, tags=['user:0'])
+        collector.histogram('my.time', 1, tags=['user:1'])
+        collector.increment('my.other')
+        collector.flush()
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 1, tags=['user:0']),
+            call('my.other', 1, tags=['overflow:true']),
+        ], any_order=True)
+        self.dogstatsd.histogram.assert_has_calls([
+            call('my.time', 1, tags=['user:0']),
+            call('my.time', 1, tags=['overflow:true']),
+        ], any_order=True)
+        self.assertEqual(collector.capped_metrics, set(['my.time', 'my.other']))
+
+    def test_max_series_resets_with_containers(self):
+        collector = DogstatsdCollector(self.dogstatsd, max_series=1)
+        collector.increment('my.metric', tags=['user:0'])
+        collector.flush(reset=True)
+        collector.increment('my.metric', tags=['user:1'])
+        collector.flush(reset=True)
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 1, tags=['user:0']),
+            call('my.metric', 1, tags=['user:1']),
+        ])
+
+    def test_max_series_per_metric_with_stored_histograms(self):
+        collector = DogstatsdCollector(
+            self.dogstatsd, histogram_modes={'my.time': 'samples'}, max_series_per_metric=1
+        )
+        collector.histogram('my.time', 1, tags=['user:0'])
+        collector.histogram('my.time', 2, tags=['user:1'])
+        collector.flush()
+        self.dogstatsd.histogram.assert_has_calls([
+            call('my.time', 1, tags=['user:0']),
+            call('my.time', 2, tags=['overflow:true']),
+        ], any_order=True)
+
+    def test_max_bytes_flushes_early(self):
+        # Room for one metric with two series.
+        max_bytes = DogstatsdCollector.METRIC_BYTES + 2 * DogstatsdCollector.SERIES_BYTES
+        collector = DogstatsdCollector(self.dogstatsd, max_bytes=max_bytes, collect_stats=True)
+        collector.increment('my.metric', tags=['user:0'])
+        collector.increment('my.metric', tags=['user:1'])
+        collector.increment('my.metric', tags=['user:1'])
+        self.dogstatsd.increment.assert_not_called()
+
+        collector.increment('my.metric', tags=['user:2'])
+        self.assertEqual(collector.partial_flushes, 1)
+        self.assertEqual(collector.stats.partial_flushes, 1)
+        self.assertEqual(collector._bytes, 0)
+        self.assertEqual(collector._increments, {})
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 1, tags=['user:0']),
+            call('my.metric', 2, tags=['user:1']),
+            call('my.metric', 1, tags=['user:2']),
+        ], any_order=True)
+
+    def test_max_bytes_with_stored_histograms(self):
+        collector = DogstatsdCollector(
+            self.dogstatsd, histogram_modes={'my.time': 'samples'}, max_histogram_samples=4, max_bytes=1000,
+        )
+        collector.histogram('my.time', 1, tags=['user:0'])
+        self.assertEqual(collector.partial_flushes, 0)
+        collector.histogram('my.time', 2, tags=['user:1'])
+        self.assertEqual(collector.partial_flushes, 1)
+        self.assertEqual(self.dogstatsd.histogram.call_count, 2)
+
+    def test_max_bytes_with_many(self):
+        collector = DogstatsdCollector(self.dogstatsd, max_bytes=DogstatsdCollector.METRIC_BYTES)
+        collector.increment_many([
+            ('my.metric', 1, ['user:0']),
+            ('my.metric', 2, ['user:1']),
+            ('my.other', 3, None),
+        ])
+        collector.flush()
+        self.assertEqual(collector.partial_flushes, 3)
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 1, tags=['user:0']),
+            call('my.metric', 2, tags=['user:1']),
+            call('my.other', 3, tags=[]),
+        ], any_order=True)
+
+    def test_increment_many_with_tuples(self):
+        self.collector.increment_many([
+            ('my.metric', 1, ['tag1:value1']),
+            ('my.metric', 2, ['tag1:value1']),
+            ('my.metric', 3, ['tag1:value2']),
+            ('my.other', 4, None),
+        ])
+        self.collector.flush()
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 3, tags=['tag1:value1']),
+            call('my.metric', 3, tags=['tag1:value2']),
+            call('my.other', 4, tags=[]),
+        ], any_order=True)
+        self.assertEqual(self.dogstatsd.increment.call_count, 3)
+
+    def test_increment_many_with_shared_tags(self):
+        self.collector.increment('my.metric', tags=['tag1:value1'])
+        self.collector.increment_many('my.metric', [1, 2, 3], tags=['tag1:value1'])
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 7, tags=['tag1:value1'])
+
+    def test_increment_many_with_no_values(self):
+        self.collector.increment_many('my.metric', iter([]))
+        self.collector.increment_many([])
+        self.assertEqual(self.collector._increments, {})
+
+    def test_histogram_many_sums_by_default(self):
+        self.collector.histogram_many('my.metric', (x for x in [1, 2, 3]))
+        self.collector.flush()
+        self.dogstatsd.histogram.assert_called_once_with('my.metric', 6, tags=[])
+
+    def test_histogram_many_with_samples_mode(self):
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.metric': 'samples'})
+        collector.histogram_many([('my.metric', 1, ['tag1:value1']), ('my.metric', 2, ['tag1:value1'])])
+        collector.histogram_many('my.metric', [3], tags=['tag1:value1'])
+        collector.flush()
+        self.dogstatsd.histogram.assert_has_calls([
+            call('my.metric', 1, tags=['tag1:value1']),
+            call('my.metric', 2, tags=['tag1:value1']),
+            call('my.metric', 3, tags=['tag1:value1']),
+        ])
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_histogram_many_with_numpy_array(self):
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.metric': 'summary'})
+        collector.histogram_many('my.metric', numpy.arange(1, 101, dtype=float), tags=['tag1:value1'])
+        collector.increment_many('my.count', numpy.ones(10))
+        collector.flush()
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric.count', 100, tags=['tag1:value1']),
+            call('my.count', 10, tags=[]),
+        ], any_order=True)
+
+    def test_counter_handle(self):
+        handle = self.collector.counter('my.metric', tags=['tag1:value1'])
+        for _ in range(3):
+            handle.add()
+        handle.add(2)
+        self.collector.increment('my.metric', tags=['tag1:value1'])
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 6, tags=['tag1:value1'])
+
+    def test_counter_handle_is_shared(self):
+        self.assertIs(
+            self.collector.counter('my.metric', tags=['a:1', 'b:2']),
+            self.collector.counter('my.metric', tags=['b:2', 'a:1']),
+        )
+
+    def test_counter_handle_survives_reset(self):
+        handle = self.collector.counter('my.metric')
+        handle.add()
+        self.collector.flush(reset=True)
+        self.collector.flush(reset=True)
+        handle.add(2)
+        self.collector.flush(reset=True)
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 1, tags=[]),
+            call('my.metric', 2, tags=[]),
+        ])
+        self.assertEqual(self.dogstatsd.increment.call_count, 2)
+
+    def test_counter_handle_without_reset(self):
+        handle = self.collector.counter('my.metric')
+        handle.add()
+        self.collector.flush()
+        handle.add()
+        self.collector.flush()
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 1, tags=[]),
+            call('my.metric', 2, tags=[]),
+        ])
+
+    def test_histogram_handle(self):
+        handle = self.collector.histogram_handle('my.metric')
+        handle.add(1)
+        handle.add(2)
+        self.collector.flush()
+        self.dogstatsd.histogram.assert_called_once_with('my.metric', 3, tags=[])
+
+    def test_histogram_handle_with_samples_mode(self):
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.metric': 'samples'})
+        handle = collector.histogram_handle('my.metric')
+        collector.histogram('my.metric', 1)
+        handle.add(2)
+        collector.flush(reset=True)
+        handle.add(3)
+        collector.flush(reset=True)
+        self.dogstatsd.histogram.assert_has_calls([
+            call('my.metric', 1, tags=[]),
+            call('my.metric', 2, tags=[]),
+            call('my.metric', 3, tags=[]),
+        ])
+
+    def test_merge(self):
+        other = DogstatsdCollector(self.dogstatsd)
+        self.collector.increment('my.metric', tags=['tag1:value1'])
+        self.collector.histogram('my.time', 1)
+        other.increment('my.metric', 2, tags=['tag1:value1'])
+        other.increment('my.metric', tags=['tag1:value2'])
+        other.increment('my.other')
+        self.collector.merge(other)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 3, tags=['tag1:value1']),
+            call('my.metric', 1, tags=['tag1:value2']),
+            call('my.other', 1, tags=[]),
+        ], any_order=True)
+        self.assertEqual(self.dogstatsd.increment.call_count, 3)
+        self.dogstatsd.histogram.assert_called_once_with('my.time', 1, tags=[])
+        self.assertEqual(other._increments['my.metric'][frozenset(['tag1:value1'])], 2)
+
+    def test_merge_into_smaller_collector(self):
+        other = DogstatsdCollector(self.dogstatsd)
+        self.collector.increment('my.metric', tags=['tag:0'])
+        for i in range(10):
+            other.increment('my.metric', tags=['tag:{}'.format(i)])
+        self.collector += other
+        self.assertEqual(len(self.collector._increments['my.metric']), 10)
+        self.assertEqual(self.collector._increments['my.metric'][frozenset(['tag:0'])], 2)
+        self.assertEqual(other._increments['my.metric'][frozenset(['tag:0'])], 1)
+
+    def test_merge_adds_other_base_tags(self):
+        other = DogstatsdCollector(self.dogstatsd, base_tags=['host:a'])
+        other.increment('my.metric', tags=['tag1:value1'])
+        self.collector.merge(other)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=['host:a', 'tag1:value1'])
+
+    def test_merge_histogram_stores(self):
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.time': 'samples'})
+        other = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.time': 'samples'})
+        collector.histogram('my.time', 1)
+        other.histogram('my.time', 2)
+        collector.merge(other)
+        other.histogram('my.time', 3)
+        collector.flush()
+        self.dogstatsd.histogram.assert_has_calls([
+            call('my.time', 1, tags=[]),
+            call('my.time', 2, tags=[]),
+        ])
+        self.assertEqual(self.dogstatsd.histogram.call_count, 2)
+
+    def test_merge_includes_handles(self):
+        other = DogstatsdCollector(self.dogstatsd)
+        other.counter('my.metric').add(5)
+        self.collector.merge(other)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 5, tags=[])
+
+    def test_child_flush_merges_into_parent(self):
+        parent = DogstatsdCollector(self.dogstatsd, base_tags=['host:a'])
+        for _ in range(3):
+            child = parent.child()
+            child.increment('my.metric', tags=['tag1:value1'])
+            child.flush()
+        self.dogstatsd.increment.assert_not_called()
+        parent.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 3, tags=['host:a', 'tag1:value1'])
+
+    def test_child_background_flush_merges_into_parent(self):
+        parent = DogstatsdCollector(self.dogstatsd)
+        child = parent.child()
+        child.increment('my.metric')
+        child.flush(background=True)
+        self.assertEqual(child._increments, {})
+        self.assertEqual(parent._increments['my.metric'][frozenset()], 1)
@@ -0,0 +1,160 @@
+import errno
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import patch
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector import RetryBuffer
+from dogstatsd_collector import UnixDatagramEmitter
+from dogstatsd_collector.testing import FakeAgent
+
+
+class DatagramEmitterTests(TestCase):
+    def setUp(self):
+        super(DatagramEmitterTests, self).setUp()
+        self.agent = FakeAgent(keep_payloads=True).start()
+        self.addCleanup(self.agent.stop)
+        self.emitter = self.agent.emitter()
+        self.addCleanup(self.emitter.close)
+
+    def received(self):
+        self.assertTrue(self.agent.wait_for(self.emitter.datagrams_sent))
+        return self.agent.payloads
+
+    def test_format_series_without_tags(self):
+        self.assertEqual(self.emitter.format_series('increment', 'my.metric', 1.0), 'my.metric:1.0|c')
+
+    def test_format_series_with_tags(self):
+        line = self.emitter.format_series('histogram', 'my.metric', 2.5, ['a:1', 'b:2'])
+        self.assertEqual(line, 'my.metric:2.5|h|#a:1,b:2')
+
+    def test_pack_respects_max_payload_size(self):
+        self.emitter.max_payload_size = 10
+        payloads = list(self.emitter.pack(['aaaa', 'bbbb', 'cccc']))
+        self.assertEqual(payloads, [b'aaaa\nbbbb', b'cccc'])
+
+    def test_pack_sends_oversized_line_alone(self):
+        self.emitter.max_payload_size = 4
+        payloads = list(self.emitter.pack(['aa', 'bbbbbbbb', 'cc']))
+        self.assertEqual(payloads, [b'aa', b'bbbbbbbb', b'cc'])
+
+    def test_increment_sends_single_datagram(self):
+        self.emitter.increment('my.metric', tags=['tag1:value1'])
+        self.assertEqual(self.received(), [b'my.metric:1|c|#tag1:value1'])
+
+    def test_collector_flush_packs_series(self):
+        collector = DogstatsdCollector(self.emitter, base_tags=['base:tag'])
+        for i in range(300):
+            collector.increment('my.metric', tags=['tag:{}'.format(i)])
+        collector.histogram('my.time', 0.5)
+        collector.flush()
+
+        payloads = self.received()
+        self.assertLess(len(payloads), 30)
+        for payload in payloads:
+            self.assertLessEqual(len(payload), self.emitter.max_payload_size)
+        lines = b'\n'.join(payloads).split(b'\n')
+        self.assertEqual(len(lines), 301)
+        self.assertIn(b'my.metric:1.0|c|#base:tag,tag:0', lines)
+        self.assertIn(b'my.time:0.5|h|#base:tag', lines)
+
+    def test_collector_flush_histogram_samples(self):
+        collector = DogstatsdCollector(self.emitter, histogram_modes={'my.time': 'samples'})
+        collector.histogram('my.time', 0.5, tags=['tag:a'])
+        collector.histogram('my.time', 1.5, tags=['tag:a'])
+        collector.flush()
+        self.assertEqual(self.received(), [b'my.time:0.5|h|#tag:a\nmy.time:1.5|h|#tag:a'])
+
+    def test_collector_flush_spilled_histogram_samples(self):
+        collector = DogstatsdCollector(
+            self.emitter, histogram_modes={'my.time': 'samples'}, max_histogram_samples=2,
+        )
+        for i in range(8):
+            collector.histogram('my.time', 1.0, tags=['tag:a'])
+        collector.flush()
+        self.assertEqual(self.received(), [b'my.time:1.0|h|@0.25|#tag:a\nmy.time:1.0|h|@0.25|#tag:a'])
+
+    def test_format_series_with_sample_rate(self):
+        line = self.emitter.format_line('histogram', 'my.metric', 2.5, '|#a:1', 0.5)
+        self.assertEqual(line, 'my.metric:2.5|h|@0.5|#a:1')
+        self.assertEqual(self.emitter.format_line('histogram', 'my.metric', 2.5, '', 1.0), 'my.metric:2.5|h')
+
+    def use_failing_socket(self, error, emitter=None):
+        emitter = emitter or self.emitter
+        sock = MagicMock()
+        sock.send.side_effect = error
+        emitter._socket = sock
+        emitter._pid = os.getpid()
+        return sock
+
+    def test_busy_agent_keeps_socket_open(self):
+        for error in (BlockingIOError(errno.EAGAIN, 'busy'), OSError(errno.ENOBUFS, 'no buffers')):
+            sock = self.use_failing_socket(error)
+            self.emitter.increment('my.metric')
+            self.emitter.increment('my.metric')
+            self.assertIs(self.emitter._socket, sock)
+            sock.close.assert_not_called()
+        self.assertEqual(self.emitter.payloads_dropped, 4)
+
+    def test_busy_agent_buffers_payload(self):
+        emitter = self.agent.emitter(retry_buffer=RetryBuffer())
+        sock = self.use_failing_socket(BlockingIOError(errno.EAGAIN, 'busy'), emitter)
+        emitter.increment('my.metric')
+        self.assertIs(emitter._socket, sock)
+        self.assertEqual(len(emitter.retry_buffer), 1)
+
+    def test_connection_error_reopens_socket(self):
+        sock = self.use_failing_socket(ConnectionRefusedError(errno.ECONNREFUSED, 'refused'))
+        self.emitter.increment('my.metric')
+        sock.close.assert_called_once_with()
+        self.assertIsNone(self.emitter._socket)
+        self.emitter.increment('my.metric')
+        self.assertEqual(self.received(), [b'my.metric:1|c'])
+
+
+class UnixDatagramEmitterTests(TestCase):
+    def setUp(self):
+        super(UnixDatagramEmitterTests, self).setUp()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.agent = FakeAgent(path=os.path.join(tmpdir, 'dsd.socket')).start()
+        self.addCleanup(self.agent.stop)
+        self.emitter = UnixDatagramEmitter(self.agent.path)
+        self.addCleanup(self.emitter.close)
+
+    def test_packs_large_payloads(self):
+        collector = DogstatsdCollector(self.emitter, base_tags=['base:tag'])
+        for i in range(300):
+            collector.increment('my.metric', tags=['tag:{}'.format(i)])
+        collector.flush()
+
+        self.assertTrue(self.agent.wait_for(self.emitter.datagrams_sent))
+        self.assertLessEqual(self.agent.datagrams, 2)
+        self.assertLessEqual(self.agent.max_datagram_size, 8192)
+        self.assertGreater(self.agent.max_datagram_size, 1432)
+        self.assertEqual(self.agent.counter('my.metric', ['base:tag', 'tag:299']), 1)
+
+    def test_keeps_socket_open(self):
+        self.emitter.increment('my.metric')
+        sock = self.emitter._socket
+        self.emitter.increment('my.metric')
+        self.assertIs(self.emitter._socket, sock)
+        self.assertTrue(self.agent.wait_for(2))
+
+    def test_reconnects_after_fork(self):
+        self.emitter.increment('my.metric')
+        sock = self.emitter._socket
+        with patch('dogstatsd_collector.emitter.os.getpid', return_value=-1):
+            self.emitter.increment('my.metric')
+        self.assertIsNot(self.emitter._socket, sock)
+        self.assertEqual(sock.fileno(), -1)
+        self.assertTrue(self.agent.wait_for(2))
+
+    def test_missing_socket_drops_payload(self):
+        emitter = UnixDatagramEmitter(self.agent.path + '.missing')
+        emitter.increment('my.metric')
+        self.assertEqual(emitter.payloads_dropped, 1)
@@ -0,0 +1,102 @@
+import random
+from unittest import TestCase
+
+from dogstatsd_collector.histograms import HistogramStore
+from dogstatsd_collector.histograms import QuantileSketch
+
+
+class QuantileSketchTests(TestCase):
+    def test_empty(self):
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(0)
+        values = [rng.lognormvariate(0, 2) for _ in range(10000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+        values.sort()
+        for q in (0.01, 0.5, 0.9, 0.99):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / expected, 1, delta=0.011)
+        self.assertEqual(sketch.count, 10000)
+        self.assertEqual(sketch.min, values[0])
+        self.assertEqual(sketch.max, values[-1])
+
+    def test_negative_and_zero_values(self):
+        sketch = QuantileSketch()
+        for value in (-10, -1, 0, 0, 1, 10):
+            sketch.add(value)
+        self.assertAlmostEqual(sketch.quantile(0), -10)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertAlmostEqual(sketch.quantile(1), 10)
+
+    def test_merge(self):
+        a = QuantileSketch()
+        b = QuantileSketch()
+        for value in range(1, 101):
+            (a if value % 2 else b).add(value)
+        a.merge(b)
+        self.assertEqual(a.count, 100)
+        self.assertEqual(a.sum, 5050)
+        self.assertAlmostEqual(a.quantile(0.5), 50, delta=1)
+
+    def test_merge_different_accuracy(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+    def test_non_finite_values(self):
+        sketch = QuantileSketch()
+        for value in (float('inf'), float('-inf'), float('nan')):
+            with self.assertRaises(ValueError):
+                sketch.add(value)
+        self.assertEqual(sketch.count, 0)
+
+
+class HistogramStoreTests(TestCase):
+    def test_keeps_exact_samples(self):
+        store = HistogramStore(max_samples=10)
+        for value in (3, 1, 2):
+            store.add(value)
+        self.assertIsNone(store.sketch)
+        self.assertEqual(store.values(), [3, 1, 2])
+        self.assertEqual((store.count, store.min, store.max, store.sum), (3, 1, 3, 6))
+        self.assertEqual(store.quantile(0.5), 2)
+        self.assertEqual(store.sample_rate(), 1.0)
+
+    def test_spills_into_sketch(self):
+        store = HistogramStore(max_samples=10)
+        for value in range(1, 1001):
+            store.add(value)
+        self.assertIsNotNone(store.sketch)
+        self.assertEqual(len(store.samples), 0)
+        self.assertEqual(store.count, 1000)
+        self.assertEqual(len(store.values()), 10)
+        self.assertEqual(store.sample_rate(), 0.01)
+        self.assertAlmostEqual(store.quantile(0.5), 500, delta=10)
+
+    def test_merge(self):
+        a = HistogramStore(max_samples=10)
+        b = HistogramStore(max_samples=10)
+        a.add(1)
+        for value in range(20):
+            b.add(value)
+        a.merge(b)
+        self.assertEqual(a.count, 21)
+
+    def test_ignores_non_finite_values(self):
+        store = HistogramStore(max_samples=2)
+        store.extend([1, float('nan'), 2])
+        for value in (float('inf'), 3, float('-inf'), 4):
+            store.add(value)
+        self.assertIsNotNone(store.sketch)
+        self.assertEqual((store.count, store.weight, store.min, store.max), (4, 4, 1, 4))
+
+    def test_summary(self):
+        store = HistogramStore()
+        for value in range(1, 101):
+            store.add(value)
+        summary = dict(store.summary([50, 99]))
+        self.assertEqual(summary, {
+            'count': 100, 'min': 1, 'max': 100, 'avg': 50.5, 'p50': 51, 'p99': 99,
+        })
@@ -0,0 +1,69 @@
+import threading
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import call
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector import IntervalFlusher
+from dogstatsd_collector import ThreadedDogstatsdCollector
+
+
+class IntervalFlusherTests(TestCase):
+    def setUp(self):
+        super(IntervalFlusherTests, self).setUp()
+        self.dogstatsd = MagicMock()
+        self.collector = ThreadedDogstatsdCollector(self.dogstatsd)
+
+    def test_flushes_every_interval(self):
+        flushed = threading.Event()
+        self.dogstatsd.increment.side_effect = lambda *args, **kwargs: flushed.set()
+        flusher = IntervalFlusher(self.collector, interval=0.01).start()
+        self.addCleanup(flusher.stop, flush=False)
+
+        self.collector.increment('my.metric')
+        self.assertTrue(flushed.wait(5))
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=[])
+
+    def test_stop_flushes_remaining_series(self):
+        with IntervalFlusher(self.collector, interval=60):
+            self.collector.increment('my.metric', 2)
+            self.collector.increment('my.metric', 3)
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 5, tags=[])
+
+    def test_only_changed_series_are_emitted(self):
+        flusher = IntervalFlusher(self.collector, interval=60)
+        self.collector.increment('my.metric', tags=['tag:a'])
+        self.collector.increment('my.metric', tags=['tag:b'])
+        flusher.flush()
+        self.collector.increment('my.metric', tags=['tag:b'])
+        flusher.flush()
+        flusher.flush()
+        self.assertEqual(self.dogstatsd.increment.call_count, 3)
+        self.dogstatsd.increment.assert_has_calls([call('my.metric', 1, tags=['tag:b'])])
+
+    def test_flush_errors_are_logged(self):
+        self.dogstatsd.increment.side_effect = RuntimeError()
+        self.collector.increment('my.metric')
+        with self.assertLogs('dogstatsd_collector.interval', 'ERROR'):
+            IntervalFlusher(self.collector).flush()
+
+    def test_start_is_idempotent(self):
+        flusher = IntervalFlusher(self.collector, interval=60).start()
+        thread = flusher._thread
+        flusher.start()
+        self.assertIs(flusher._thread, thread)
+        flusher.stop()
+        self.assertFalse(thread.is_alive())
+
+    def test_requires_threaded_collector(self):
+        with self.assertRaises(TypeError):
+            IntervalFlusher(DogstatsdCollector(self.dogstatsd))
+
+    def test_no_values_lost_while_recording_during_flushes(self):
+        with IntervalFlusher(self.collector, interval=0.0005):
+            for _ in range(100000):
+                self.collector.increment('my.metric')
+        self.assertGreater(self.dogstatsd.increment.call_count, 1)
+        total = sum(args[1] for args, kwargs in self.dogstatsd.increment.call_args_list)
+        self.assertEqual(total, 100000)
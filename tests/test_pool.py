@@ -0,0 +1,171 @@
+import types
+from unittest import TestCase
+from unittest import skipIf
+
+from mock import MagicMock
+from mock import call
+from mock import patch
+
+from dogstatsd_collector import CollectorPool
+from dogstatsd_collector import ThreadedDogstatsdCollector
+from dogstatsd_collector import configure_collector_pool
+from dogstatsd_collector import pool as pool_module
+from dogstatsd_collector.contrib.django import MetricsMiddleware
+
+try:
+    import flask
+except ImportError:
+    flask = None
+
+try:
+    import celery
+except ImportError:
+    celery = None
+
+
+class CollectorPoolTests(TestCase):
+    def setUp(self):
+        super(CollectorPoolTests, self).setUp()
+        self.dogstatsd = MagicMock()
+        self.pool = CollectorPool(self.dogstatsd, max_size=2, base_tags=['base:tag'])
+
+    def test_reuses_released_collectors(self):
+        collector = self.pool.acquire()
+        self.assertEqual(collector.base_tags, ['base:tag'])
+        collector.increment('my.metric')
+        collector.flush()
+        self.pool.release(collector)
+
+        self.assertIs(self.pool.acquire(), collector)
+        collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=['base:tag'])
+
+    def test_release_resets_collector(self):
+        collector = self.pool.acquire()
+        increments = collector._increments
+        collector.increment('my.metric', tags=['tag1:value1'])
+        collector.counter('my.handle').add()
+        self.pool.release(collector)
+        self.assertIs(collector._increments, increments)
+        self.assertEqual(collector._get_metric_containers(), {'histogram': {}, 'increment': {}})
+
+    def test_release_drops_handles_and_timers(self):
+        collector = self.pool.acquire()
+        for i in range(10):
+            collector.counter('my.handle', tags=['request:{}'.format(i)]).add()
+            with collector.timed('my.time', tags=['request:{}'.format(i)]):
+                pass
+        self.pool.release(collector)
+        self.assertEqual(collector._handles, {})
+        self.assertEqual(collector._timers, {})
+
+    def test_max_size(self):
+        collectors = [self.pool.acquire() for _ in range(3)]
+        for collector in collectors:
+            self.pool.release(collector)
+        self.assertEqual(len(self.pool._idle), 2)
+
+    def test_collector_context_manager(self):
+        with self.pool.collector() as collector:
+            collector.increment('my.metric')
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=['base:tag'])
+        self.assertEqual(self.pool._idle, [collector])
+
+    def test_process_wide_pool(self):
+        with patch.object(pool_module, '_pool', None):
+            with self.assertRaises(RuntimeError):
+                pool_module.get_collector_pool()
+            pool = configure_collector_pool(self.dogstatsd)
+            self.assertIs(pool_module.get_collector_pool(), pool)
+
+    def test_threaded_collector_reset(self):
+        collector = ThreadedDogstatsdCollector(self.dogstatsd)
+        collector.increment('my.metric')
+        collector.flush(reset=True)
+        collector.increment('my.metric')
+        collector.reset()
+        collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=[])
+
+
+class DjangoMiddlewareTests(TestCase):
+    def setUp(self):
+        super(DjangoMiddlewareTests, self).setUp()
+        self.dogstatsd = MagicMock()
+        self.pool = CollectorPool(self.dogstatsd)
+        patcher = patch.object(pool_module, '_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flushes_and_releases(self):
+        def view(request):
+            request.metrics.increment('my.metric')
+            return 'ok'
+
+        middleware = MetricsMiddleware(view)
+        request = types.SimpleNamespace()
+        self.assertEqual(middleware(request), 'ok')
+        self.assertEqual(middleware(request), 'ok')
+
+        self.assertFalse(hasattr(request, 'metrics'))
+        self.assertEqual(self.dogstatsd.increment.call_args_list, [call('my.metric', 1, tags=[])] * 2)
+        self.assertEqual(len(self.pool._idle), 1)
+
+    def test_flushes_when_view_raises(self):
+        def view(request):
+            request.metrics.increment('my.metric')
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            MetricsMiddleware(view)(types.SimpleNamespace())
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=[])
+        self.assertEqual(len(self.pool._idle), 1)
+
+
+@skipIf(flask is None, 'Flask is not installed')
+class FlaskIntegrationTests(TestCase):
+    def test_flushes_and_releases(self):
+        from dogstatsd_collector.contrib.flask import init_app
+
+        dogstatsd = MagicMock()
+        pool = CollectorPool(dogstatsd)
+        app = flask.Flask(__name__)
+        init_app(app, pool)
+
+        @app.route('/')
+        def view():
+            flask.request.metrics.increment('my.metric')
+            return 'ok'
+
+        client = app.test_client()
+        client.get('/')
+        client.get('/')
+        self.assertEqual(dogstatsd.increment.call_args_list, [call('my.metric', 1, tags=[])] * 2)
+        self.assertEqual(len(pool._idle), 1)
+
+
+@skipIf(celery is None, 'Celery is not installed')
+class CeleryIntegrationTests(TestCase):
+    def test_flushes_and_releases(self):
+        from celery.signals import task_postrun
+        from celery.signals import task_prerun
+
+        from dogstatsd_collector.contrib.celery import connect
+
+        dogstatsd = MagicMock()
+        pool = CollectorPool(dogstatsd)
+        handlers = connect(pool)
+        self.addCleanup(task_prerun.disconnect, handlers[0])
+        self.addCleanup(task_postrun.disconnect, handlers[1])
+
+        app = celery.Celery('tests', set_as_current=False)
+        app.conf.task_always_eager = True
+
+        @app.task(bind=True)
+        def my_task(self):
+            self.request.metrics.increment('my.metric')
+
+        my_task.delay()
+        my_task.delay()
+        self.assertEqual(dogstatsd.increment.call_args_list, [call('my.metric', 1, tags=[])] * 2)
+        self.assertEqual(len(pool._idle), 1)
@@ -0,0 +1,171 @@
+import os
+import shutil
+import socket
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+from dogstatsd_collector import IntervalFlusher
+from dogstatsd_collector import RetryBuffer
+from dogstatsd_collector import ThreadedDogstatsdCollector
+from dogstatsd_collector.testing import FakeAgent
+
+
+class RetryBufferTests(TestCase):
+    def setUp(self):
+        super(RetryBufferTests, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def drain(self, buffer):
+        payloads = []
+        while buffer.peek() is not None:
+            payloads.append(buffer.peek())
+            buffer.pop()
+        return payloads
+
+    def test_keeps_payloads_in_order(self):
+        buffer = RetryBuffer()
+        for payload in (b'a', b'b', b'c'):
+            buffer.add(payload)
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(self.drain(buffer), [b'a', b'b', b'c'])
+        self.assertEqual(buffer.bytes, 0)
+
+    def test_drops_oldest_when_full(self):
+        buffer = RetryBuffer(max_bytes=4)
+        self.assertEqual(buffer.add(b'aa'), 0)
+        self.assertEqual(buffer.add(b'bb'), 0)
+        self.assertEqual(buffer.add(b'cc'), 1)
+        self.assertEqual(buffer.add(b'too large'), 1)
+        self.assertEqual(buffer.dropped, 2)
+        self.assertEqual(self.drain(buffer), [b'bb', b'cc'])
+
+    def test_spills_oldest_to_file(self):
+        path = os.path.join(self.tmpdir, 'spill')
+        buffer = RetryBuffer(max_bytes=4, spill_path=path, max_spill_bytes=20)
+        for payload in (b'aa', b'bb', b'cc', b'dd', b'ee', b'ff', b'gg'):
+            buffer.add(payload)
+        # Each spilled payload takes 6 bytes of the file, so only three fit
+        # and dd and ee are dropped.
+        self.assertEqual(buffer.dropped, 2)
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(self.drain(buffer), [b'aa', b'bb', b'cc', b'ff', b'gg'])
+        self.assertEqual(os.path.getsize(path), 0)
+
+        buffer.add(b'hh')
+        buffer.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_spill_file_is_compacted_as_payloads_are_consumed(self):
+        path = os.path.join(self.tmpdir, 'spill')
+        buffer = RetryBuffer(max_bytes=2, spill_path=path, max_spill_bytes=24)
+        for payload in (b'aa', b'bb', b'cc', b'dd', b'ee'):
+            buffer.add(payload)
+        self.assertEqual(os.path.getsize(path), 24)
+        buffer.pop()
+        self.assertEqual(os.path.getsize(path), 24)
+        buffer.pop()
+        # Half of the file has been consumed, so the rest is moved to the
+        # start.
+        self.assertEqual(os.path.getsize(path), 12)
+        buffer.pop()
+        # The file has room again, and payloads stay in order.
+        for payload in (b'ff', b'gg', b'hh'):
+            buffer.add(payload)
+        self.assertEqual(buffer.dropped, 0)
+        self.assertEqual(self.drain(buffer), [b'dd', b'ee', b'ff', b'gg', b'hh'])
+
+    def test_full_spill_file_is_compacted(self):
+        path = os.path.join(self.tmpdir, 'spill')
+        buffer = RetryBuffer(max_bytes=2, spill_path=path, max_spill_bytes=18)
+        for payload in (b'aa', b'bb', b'cc', b'dd'):
+            buffer.add(payload)
+        buffer.pop()
+        # The file is full, but the consumed payload's space is reclaimed.
+        buffer.add(b'ee')
+        self.assertEqual(buffer.dropped, 0)
+        self.assertEqual(self.drain(buffer), [b'bb', b'cc', b'dd', b'ee'])
+
+    @patch('dogstatsd_collector.retry.monotonic')
+    def test_backoff(self, monotonic):
+        monotonic.return_value = 100
+        buffer = RetryBuffer(initial_backoff=1, max_backoff=3)
+        self.assertTrue(buffer.ready())
+        buffer.failed()
+        self.assertFalse(buffer.ready())
+        monotonic.return_value = 101
+        self.assertTrue(buffer.ready())
+        buffer.failed()
+        monotonic.return_value = 102.5
+        self.assertFalse(buffer.ready())
+        buffer.failed()
+        buffer.failed()
+        monotonic.return_value = 105.5
+        self.assertTrue(buffer.ready())
+        buffer.succeeded()
+        buffer.failed()
+        monotonic.return_value = 106.5
+        self.assertTrue(buffer.ready())
+
+
+class EmitterRetryTests(TestCase):
+    def setUp(self):
+        super(EmitterRetryTests, self).setUp()
+        self.agent = FakeAgent(keep_payloads=True).start()
+        self.addCleanup(self.agent.stop)
+        self.buffer = RetryBuffer(initial_backoff=0)
+        self.emitter = self.agent.emitter(retry_buffer=self.buffer)
+        self.addCleanup(self.emitter.close)
+
+    def received(self):
+        self.assertTrue(self.agent.wait_for(self.emitter.datagrams_sent))
+        return self.agent.payloads
+
+    def test_failed_payloads_are_replayed_in_order(self):
+        error = socket.error(105, 'No buffer space available')
+        with patch.object(self.emitter, '_get_socket', side_effect=error):
+            self.emitter.emit_lines(['a:1|c'])
+            self.emitter.emit_lines(['b:1|c'])
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.emitter.payloads_dropped, 0)
+
+        self.emitter.emit_lines(['c:1|c'])
+        self.assertEqual(self.received(), [b'a:1|c', b'b:1|c', b'c:1|c'])
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.emitter.datagrams_sent, 3)
+
+    def test_waits_for_backoff(self):
+        self.buffer.initial_backoff = 60
+        with patch.object(self.emitter, '_get_socket', side_effect=socket.error()):
+            self.emitter.emit_lines(['a:1|c'])
+        self.emitter.emit_lines(['b:1|c'])
+        self.assertEqual(self.emitter.datagrams_sent, 0)
+        self.assertEqual(len(self.buffer), 2)
+
+        self.buffer.succeeded()
+        self.assertTrue(self.emitter.replay())
+        self.assertEqual(self.received(), [b'a:1|c', b'b:1|c'])
+
+    def test_counts_payloads_dropped_from_full_buffer(self):
+        self.buffer.max_bytes = 5
+        with patch.object(self.emitter, '_get_socket', side_effect=socket.error()):
+            self.emitter.emit_lines(['a:1|c'])
+            self.emitter.emit_lines(['b:1|c'])
+        self.assertEqual(self.emitter.payloads_dropped, 1)
+        self.emitter.replay()
+        self.assertEqual(self.received(), [b'b:1|c'])
+
+    def test_interval_flusher_replays_without_new_payloads(self):
+        collector = ThreadedDogstatsdCollector(self.emitter)
+        with patch.object(self.emitter, '_get_socket', side_effect=socket.error()):
+            collector.increment('my.metric')
+            collector.flush(reset=True)
+        self.assertEqual(len(self.buffer), 1)
+
+        # Nothing new is recorded, so only the flusher retries the payload.
+        flusher = IntervalFlusher(collector, interval=0.01).start()
+        self.addCleanup(flusher.stop, flush=False)
+        self.assertTrue(self.agent.wait_for(1))
+        self.assertEqual(self.agent.payloads, [b'my.metric:1.0|c'])
@@ -0,0 +1,113 @@
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import patch
+
+from dogstatsd_collector import AdaptiveSampler
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector import ThreadedDogstatsdCollector
+from dogstatsd_collector.aggregator import parse_line
+
+
+class SampleRateTests(TestCase):
+    def setUp(self):
+        super(SampleRateTests, self).setUp()
+        self.dogstatsd = MagicMock()
+        self.collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.samples': 'samples'})
+
+    @patch('dogstatsd_collector.base.random')
+    def test_increment_scales_kept_values(self, random):
+        random.side_effect = [0.1, 0.9, 0.2]
+        for _ in range(3):
+            self.collector.increment('my.metric', sample_rate=0.5)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 4.0, tags=[])
+
+    @patch('dogstatsd_collector.base.random')
+    def test_skipped_call_records_nothing(self, random):
+        random.return_value = 0.9
+        self.collector.increment('my.metric', sample_rate=0.5)
+        self.assertEqual(self.collector._increments, {})
+
+    @patch('dogstatsd_collector.base.random')
+    def test_histogram_sum_is_scaled(self, random):
+        random.return_value = 0.1
+        self.collector.histogram('my.time', 2, sample_rate=0.25)
+        self.collector.flush()
+        self.dogstatsd.histogram.assert_called_once_with('my.time', 8.0, tags=[])
+
+    @patch('dogstatsd_collector.base.random')
+    def test_histogram_samples_are_not_scaled(self, random):
+        random.return_value = 0.1
+        self.collector.histogram('my.samples', 2, sample_rate=0.25)
+        self.collector.flush()
+        self.dogstatsd.histogram.assert_called_once_with('my.samples', 2, tags=[])
+
+    @patch('dogstatsd_collector.base.random')
+    def test_histogram_summary_count_is_weighted(self, random):
+        random.side_effect = [0.05, 0.5] * 50
+        collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.summary': 'summary'})
+        for i in range(100):
+            collector.histogram('my.summary', i % 2, sample_rate=0.1)
+        collector.flush()
+        # Half of the calls are kept, each standing for 10 calls.
+        self.dogstatsd.increment.assert_called_once_with('my.summary.count', 500.0, tags=[])
+        self.dogstatsd.histogram.assert_any_call('my.summary.avg', 0.0, tags=[])
+
+    def test_full_sample_rate(self):
+        self.collector.increment('my.metric', sample_rate=1)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=[])
+
+    @patch('dogstatsd_collector.threaded.random')
+    def test_threaded_collector(self, random):
+        random.side_effect = [0.1, 0.9]
+        collector = ThreadedDogstatsdCollector(self.dogstatsd)
+        collector.increment('my.metric', sample_rate=0.5)
+        collector.increment('my.metric', sample_rate=0.5)
+        collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 2.0, tags=[])
+
+    def test_parse_line_scales_sampled_counters(self):
+        self.assertEqual(parse_line('my.metric:1|c|@0.25|#a:1'), ('increment', 'my.metric', 4.0, ['a:1']))
+        self.assertEqual(parse_line('my.time:1|h|@0.25'), ('histogram', 'my.time', 1.0, []))
+
+
+@patch('dogstatsd_collector.sampling.monotonic')
+class AdaptiveSamplerTests(TestCase):
+    def test_lowers_rate_of_busy_metrics(self, monotonic):
+        monotonic.return_value = 0
+        sampler = AdaptiveSampler(max_calls=10, interval=1.0)
+        for _ in range(40):
+            self.assertEqual(sampler.rate('busy'), 1.0)
+        sampler.rate('quiet')
+        monotonic.return_value = 1.0
+        self.assertEqual(sampler.rate('busy'), 0.25)
+        self.assertEqual(sampler.rate('quiet'), 1.0)
+        self.assertEqual(sampler.rates, {'busy': 0.25})
+
+        # The rate recovers once the call rate drops.
+        monotonic.return_value = 2.0
+        self.assertEqual(sampler.rate('busy'), 1.0)
+
+    def test_min_rate(self, monotonic):
+        monotonic.return_value = 0
+        sampler = AdaptiveSampler(max_calls=1, min_rate=0.1)
+        for _ in range(100):
+            sampler.rate('busy')
+        monotonic.return_value = 1.0
+        self.assertEqual(sampler.rate('busy'), 0.1)
+
+    @patch('dogstatsd_collector.base.random')
+    def test_collector_scales_by_adaptive_rate(self, random, monotonic):
+        monotonic.return_value = 0
+        random.return_value = 0.1
+        dogstatsd = MagicMock()
+        collector = DogstatsdCollector(dogstatsd, adaptive_sampler=AdaptiveSampler(max_calls=2))
+        for _ in range(4):
+            collector.increment('my.metric')
+        monotonic.return_value = 1.0
+        collector.increment('my.metric', sample_rate=0.5)
+        collector.flush()
+        # Four calls recorded in full, then one at 0.5 * 0.5.
+        dogstatsd.increment.assert_called_once_with('my.metric', 8.0, tags=[])
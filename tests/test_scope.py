@@ -0,0 +1,81 @@
+import asyncio
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import call
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector import collector_scope
+from dogstatsd_collector import current_collector
+from dogstatsd_collector import histogram
+from dogstatsd_collector import increment
+
+
+class CollectorScopeTests(TestCase):
+    def setUp(self):
+        super(CollectorScopeTests, self).setUp()
+        self.dogstatsd = MagicMock()
+        self.collector = DogstatsdCollector(self.dogstatsd, base_tags=['base:tag'])
+
+    def test_records_into_current_collector(self):
+        with collector_scope(self.collector) as metrics:
+            self.assertIs(metrics, self.collector)
+            self.assertIs(current_collector(), self.collector)
+            increment('my.metric', tags=['tag1:value1'])
+            histogram('my.time', 0.5)
+        self.assertIsNone(current_collector())
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=['base:tag', 'tag1:value1'])
+        self.dogstatsd.histogram.assert_called_once_with('my.time', 0.5, tags=['base:tag'])
+
+    def test_no_op_outside_scope(self):
+        increment('my.metric')
+        histogram('my.time', 0.5)
+        self.assertIsNone(current_collector())
+
+    def test_nested_scope_merges_into_parent(self):
+        with collector_scope(self.collector):
+            increment('my.metric')
+            with collector_scope() as child:
+                self.assertIs(child.parent, self.collector)
+                increment('my.metric', 2)
+                self.assertEqual(self.collector._increments['my.metric'][frozenset()], 1)
+            self.assertIs(current_collector(), self.collector)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 3, tags=['base:tag'])
+
+    def test_nested_scope_merges_when_raising(self):
+        with collector_scope(self.collector):
+            with self.assertRaises(ValueError):
+                with collector_scope():
+                    increment('my.metric')
+                    raise ValueError()
+        self.collector.flush()
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=['base:tag'])
+
+    def test_nested_scope_needs_a_parent(self):
+        with self.assertRaises(RuntimeError):
+            with collector_scope():
+                pass
+
+    def test_asyncio_tasks_are_isolated(self):
+        seen = []
+
+        async def handle(i):
+            with collector_scope() as metrics:
+                increment('my.metric', tags=['item:{}'.format(i % 2)])
+                await asyncio.sleep(0)
+                seen.append(current_collector() is metrics)
+                increment('my.metric', tags=['item:{}'.format(i % 2)])
+
+        async def main():
+            with collector_scope(self.collector):
+                await asyncio.gather(*(handle(i) for i in range(10)))
+
+        asyncio.run(main())
+        self.assertEqual(seen, [True] * 10)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 10, tags=['base:tag', 'item:0']),
+            call('my.metric', 10, tags=['base:tag', 'item:1']),
+        ], any_order=True)
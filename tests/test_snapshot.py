@@ -0,0 +1,128 @@
+import mmap
+import multiprocessing
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import call
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.histograms import HistogramStore
+from dogstatsd_collector.snapshot import _COUNT
+from dogstatsd_collector.snapshot import METRIC_TYPES
+from dogstatsd_collector.snapshot import dumps
+from dogstatsd_collector.snapshot import loads
+
+
+def _collect_in_subprocess(i):
+    collector = DogstatsdCollector(MagicMock(), base_tags=['base:tag'])
+    collector.increment('my.metric', tags=['worker:{}'.format(i % 2)])
+    collector.histogram('my.time', i)
+    return collector.dumps()
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        super(SnapshotTests, self).setUp()
+        self.dogstatsd = MagicMock()
+
+    def test_round_trip(self):
+        collector = DogstatsdCollector(self.dogstatsd, base_tags=['base:tag'])
+        collector.increment('my.metric', tags=['tag1:value1', 'tag2:value2'])
+        collector.increment('my.metric', 3, tags=['tag2:value2'])
+        collector.increment('other.metric')
+        collector.histogram('my.time', 0.25, tags=['tag1:value1'])
+
+        loaded = DogstatsdCollector.loads(collector.dumps(), self.dogstatsd)
+        self.assertEqual(loaded.base_tags, ['base:tag'])
+        self.assertEqual(loaded._get_metric_containers(), collector._get_metric_containers())
+
+    def test_string_table(self):
+        collector = DogstatsdCollector(self.dogstatsd)
+        for i in range(100):
+            collector.increment('a.long.metric.name.{}'.format(i % 2), tags=['a.long:tag-value'])
+        data = collector.dumps()
+        self.assertEqual(data.count(b'a.long:tag-value'), 1)
+        self.assertEqual(data.count(b'a.long.metric.name.0'), 1)
+
+    def test_histogram_stores(self):
+        collector = DogstatsdCollector(
+            self.dogstatsd,
+            histogram_modes={'my.samples': 'samples', 'my.summary': 'summary'},
+            max_histogram_samples=4,
+        )
+        for value in (1.0, 2.0, 3.0):
+            collector.histogram('my.samples', value)
+        for value in range(-10, 100):
+            collector.histogram('my.summary', value)
+
+        base_tags, containers = loads(collector.dumps())
+        samples = containers['histogram']['my.samples'][frozenset()]
+        self.assertIsInstance(samples, HistogramStore)
+        self.assertEqual(samples.values(), [1.0, 2.0, 3.0])
+        summary = containers['histogram']['my.summary'][frozenset()]
+        original = collector._histograms['my.summary'][frozenset()]
+        self.assertEqual(summary.summary((50, 99)), original.summary((50, 99)))
+
+    def test_loads_from_memoryview_and_mmap(self):
+        collector = DogstatsdCollector(self.dogstatsd)
+        collector.increment('my.metric', tags=['tag1:value1'])
+        data = collector.dumps()
+
+        view = memoryview(bytearray(b'xx' + data))[2:]
+        self.assertEqual(loads(view), loads(data))
+
+        shared = mmap.mmap(-1, len(data))
+        self.addCleanup(shared.close)
+        shared.write(data)
+        base_tags, containers = loads(shared)
+        self.assertEqual(containers['increment']['my.metric'][frozenset(['tag1:value1'])], 1)
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            loads(b'garbage')
+        with self.assertRaises(ValueError):
+            loads(dumps({'increment': {'my.metric': {frozenset(): 1}}}, [])[:-4])
+
+    def test_long_strings(self):
+        metric = 'm' * 70000
+        tag = 'tag:' + 'v' * 70000
+        containers = {'increment': {metric: {frozenset([tag]): 1.0}}}
+        self.assertEqual(loads(dumps(containers, [tag])), ([tag], containers))
+
+    def test_corrupt_index(self):
+        data = dumps({}, [])
+        # Point the base tags at a tag set that does not exist.
+        corrupt = data[:-8] + _COUNT.pack(5) + data[-4:]
+        with self.assertRaises(ValueError):
+            loads(corrupt)
+
+    def test_unknown_metric_type(self):
+        with self.assertRaises(ValueError):
+            loads(dumps({'gauge': {'my.metric': {frozenset(): 1}}}, []))
+        with self.assertRaises(ValueError):
+            DogstatsdCollector.loads(dumps({'gauge': {'my.metric': {frozenset(): 1}}}, []), self.dogstatsd)
+
+    def test_store_for_counter(self):
+        store = HistogramStore()
+        store.add(1)
+        with self.assertRaises(ValueError):
+            loads(dumps({'increment': {'my.metric': {frozenset(): store}}}, []))
+
+    def test_metric_types_match_collector(self):
+        self.assertEqual(sorted(METRIC_TYPES), sorted(DogstatsdCollector.SUPPORTED_DOGSTATSD_METRICS))
+
+    def test_merge_snapshots_from_subprocesses(self):
+        pool = multiprocessing.Pool(2)
+        self.addCleanup(pool.terminate)
+        snapshots = pool.map(_collect_in_subprocess, range(4))
+
+        parent = DogstatsdCollector(self.dogstatsd, base_tags=['base:tag'])
+        for data in snapshots:
+            parent += DogstatsdCollector.loads(data, parent.dogstatsd)
+        parent.flush()
+
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 2, tags=['base:tag', 'worker:0']),
+            call('my.metric', 2, tags=['base:tag', 'worker:1']),
+        ], any_order=True)
+        self.dogstatsd.histogram.assert_called_once_with('my.time', 6, tags=['base:tag'])
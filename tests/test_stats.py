@@ -0,0 +1,106 @@
+import socket
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import call
+from mock import patch
+
+from dogstatsd_collector import DatagramEmitter
+from dogstatsd_collector import DogstatsdCollector
+
+
+class CollectorStatsTests(TestCase):
+    def setUp(self):
+        super(CollectorStatsTests, self).setUp()
+        self.dogstatsd = MagicMock()
+
+    def test_disabled_by_default(self):
+        collector = DogstatsdCollector(self.dogstatsd)
+        collector.increment('my.metric')
+        collector.flush()
+        self.assertIsNone(collector.stats)
+
+    def test_counts_record_calls_and_series(self):
+        collector = DogstatsdCollector(self.dogstatsd, collect_stats=True, histogram_modes={'my.time': 'samples'})
+        collector.increment('my.metric', tags=['tag1:value1'])
+        collector.increment('my.metric', tags=['tag1:value2'])
+        collector.increment('my.metric', tags=['tag1:value2'])
+        collector.histogram('my.time', 1)
+        collector.histogram('my.other', 1)
+        collector.flush()
+
+        stats = collector.stats.as_dict()
+        self.assertEqual(stats['record_calls'], 5)
+        self.assertEqual(stats['flushes'], 1)
+        self.assertEqual(stats['series'], {'histogram': 2, 'increment': 2})
+        self.assertGreater(stats['flush_time'], 0)
+        self.assertEqual(stats['flush_time'], stats['last_flush_time'])
+
+    def test_counts_each_value_recorded_in_bulk(self):
+        collector = DogstatsdCollector(self.dogstatsd, collect_stats=True, histogram_modes={'my.time': 'samples'})
+        collector.increment_many('my.metric', [1, 2, 3])
+        collector.increment_many([('my.metric', 1, None), ('my.other', 1, ['tag1:value1'])])
+        collector.histogram_many('my.time', [1, 2, 3])
+        collector.histogram_many('my.sum', [1, 2])
+        self.assertEqual(collector.stats.record_calls, 10)
+
+    def test_counts_overflowed_values(self):
+        collector = DogstatsdCollector(self.dogstatsd, collect_stats=True, max_series_per_metric=1)
+        collector.increment('my.metric', tags=['tag1:value1'])
+        collector.increment('my.metric', tags=['tag1:value2'])
+        collector.increment('my.metric', tags=['tag1:value3'])
+        self.assertEqual(collector.stats.overflowed, 2)
+
+    @patch('dogstatsd_collector.base.get_background_sender')
+    def test_counts_dropped_background_flushes(self, get_background_sender):
+        get_background_sender.return_value.submit.return_value = False
+        collector = DogstatsdCollector(self.dogstatsd, collect_stats=True)
+        collector.increment('my.metric')
+        collector.flush(background=True)
+        self.assertEqual(collector.stats.dropped_flushes, 1)
+
+    def test_counts_datagrams_and_bytes(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind(('127.0.0.1', 0))
+        self.addCleanup(listener.close)
+        emitter = DatagramEmitter(host='127.0.0.1', port=listener.getsockname()[1], max_payload_size=100)
+        self.addCleanup(emitter.close)
+        collector = DogstatsdCollector(emitter, collect_stats=True)
+        for i in range(20):
+            collector.increment('my.metric', tags=['tag:{}'.format(i)])
+        collector.flush()
+
+        self.assertGreater(collector.stats.datagrams, 1)
+        self.assertEqual(collector.stats.datagrams, emitter.datagrams_sent)
+        self.assertEqual(collector.stats.bytes, emitter.bytes_sent)
+
+    def test_emit_stats(self):
+        collector = DogstatsdCollector(self.dogstatsd, base_tags=['base:tag'], emit_stats=True)
+        collector.increment('my.metric')
+        collector.increment('my.metric')
+        collector.flush()
+
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 2, tags=['base:tag']),
+            call('dogstatsd_collector.record_calls', 2, tags=['base:tag']),
+            call('dogstatsd_collector.flushes', 1, tags=['base:tag']),
+        ], any_order=True)
+        self.dogstatsd.histogram.assert_any_call(
+            'dogstatsd_collector.series', 1, tags=['base:tag', 'metric_type:increment']
+        )
+
+        # Counters are emitted as deltas since the previous flush.
+        self.dogstatsd.reset_mock()
+        collector.increment('my.metric')
+        collector.flush(reset=True)
+        self.dogstatsd.increment.assert_any_call('dogstatsd_collector.record_calls', 1, tags=['base:tag'])
+
+    def test_reset(self):
+        collector = DogstatsdCollector(self.dogstatsd, collect_stats=True)
+        collector.increment('my.metric')
+        collector.flush()
+        collector.stats.reset()
+        stats = collector.stats.as_dict()
+        self.assertEqual(stats['record_calls'], 0)
+        self.assertEqual(stats['flushes'], 0)
+        self.assertEqual(stats['series'], {})
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from mock import patch
+
+from dogstatsd_collector import tags
+from dogstatsd_collector.tags import TagInterner
+from dogstatsd_collector.tags import serialize_tags
+
+
+class _DroppingDict(dict):
+    def __setitem__(self, key, value):
+        pass
+
+
+class SerializeTagsTests(TestCase):
+    def test_no_tags(self):
+        self.assertEqual(serialize_tags([]), '')
+        self.assertEqual(serialize_tags(None), '')
+
+    def test_tags(self):
+        self.assertEqual(serialize_tags(['a:1', 'b:2']), '|#a:1,b:2')
+
+
+class TagInternerTests(TestCase):
+    def setUp(self):
+        super(TagInternerTests, self).setUp()
+        self.interner = TagInterner(base_tags=['base:tag'])
+
+    def test_key_is_shared_regardless_of_order(self):
+        key1 = self.interner.key(('b:2', 'a:1'))
+        key2 = self.interner.key(('a:1', 'b:2'))
+        self.assertIs(key1, key2)
+        self.assertEqual(key1, frozenset(['a:1', 'b:2']))
+
+    def test_key_is_cached(self):
+        tags = ('a:1',)
+        self.assertIs(self.interner.key(tags), self.interner.key(tags))
+
+    def test_tags_are_sorted_with_base_tags(self):
+        key = self.interner.key(('z:1', 'a:1'))
+        self.assertEqual(self.interner.tags(key), ['a:1', 'base:tag', 'z:1'])
+
+    def test_serialized(self):
+        key = self.interner.key(('z:1', 'a:1'))
+        self.assertEqual(self.interner.serialized(key), '|#a:1,base:tag,z:1')
+
+    def test_serialized_for_unknown_key(self):
+        self.assertEqual(self.interner.serialized(frozenset(['a:1'])), '|#a:1,base:tag')
+
+    def test_evicts_oldest_when_full(self):
+        interner = TagInterner(max_size=2)
+        for tag in ('a:1', 'b:1', 'c:1'):
+            interner.serialized(interner.key((tag,)))
+        self.assertEqual(list(interner._keys), [('b:1',), ('c:1',)])
+        self.assertEqual(list(interner._serialized.values()), ['|#b:1', '|#c:1'])
+
+    def test_tags_survive_concurrent_clear(self):
+        interner = TagInterner()
+        key = frozenset(['a:1'])
+        # Drop every write to the tables, as if another thread cleared them
+        # between caching and reading back.
+        with patch.object(interner, '_tags', _DroppingDict()), \
+                patch.object(interner, '_serialized', _DroppingDict()):
+            self.assertEqual(interner.tags(key), ['a:1'])
+            self.assertEqual(interner.serialized(key), '|#a:1')
+
+    def test_for_base_tags_is_shared(self):
+        self.assertIs(TagInterner.for_base_tags(['x:1']), TagInterner.for_base_tags(('x:1',)))
+        self.assertIsNot(TagInterner.for_base_tags(['x:1']), TagInterner.for_base_tags(None))
+
+    def test_for_base_tags_is_bounded(self):
+        first = TagInterner.for_base_tags(['first:1'])
+        for i in range(tags.MAX_SHARED_INTERNERS * 2):
+            TagInterner.for_base_tags(['distinct:{}'.format(i)])
+            # Keep the first interner recently used.
+            self.assertIs(TagInterner.for_base_tags(['first:1']), first)
+        self.assertEqual(len(tags._interners), tags.MAX_SHARED_INTERNERS)
+        self.assertNotIn(('distinct:0',), tags._interners)
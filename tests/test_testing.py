@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector.testing import FakeAgent
+
+
+class FakeAgentTests(TestCase):
+    def setUp(self):
+        super(FakeAgentTests, self).setUp()
+        self.agent = FakeAgent().start()
+        self.addCleanup(self.agent.stop)
+
+    def flush(self, collector):
+        collector.flush(reset=True)
+        self.assertTrue(self.agent.wait_for(collector.dogstatsd.datagrams_sent))
+
+    def test_aggregates_received_series(self):
+        emitter = self.agent.emitter()
+        self.addCleanup(emitter.close)
+        collector = DogstatsdCollector(emitter, base_tags=['base:tag'])
+        collector.increment('my.metric', tags=['a:1'])
+        collector.increment('my.metric', 2, tags=['a:1'])
+        collector.histogram('my.time', 0.5)
+        self.flush(collector)
+        collector.increment('my.metric', tags=['a:1'])
+        self.flush(collector)
+
+        self.assertEqual(self.agent.datagrams, 2)
+        self.assertEqual(self.agent.counter('my.metric', ['a:1', 'base:tag']), 4)
+        self.assertEqual(self.agent.counter('my.metric', ['base:tag', 'a:1']), 4)
+        self.assertEqual(self.agent.counter('my.metric'), 0)
+        self.assertEqual(self.agent.histogram_values('my.time', ['base:tag']), [0.5])
+        self.assertEqual(self.agent.series(), {
+            ('increment', 'my.metric', ('a:1', 'base:tag')): 4,
+            ('histogram', 'my.time', ('base:tag',)): [0.5],
+        })
+
+    def test_counts_datagrams_and_bytes(self):
+        emitter = self.agent.emitter(max_payload_size=200)
+        self.addCleanup(emitter.close)
+        collector = DogstatsdCollector(emitter)
+        for i in range(50):
+            collector.increment('my.metric', tags=['tag:{}'.format(i)])
+        self.flush(collector)
+
+        self.assertGreater(self.agent.datagrams, 1)
+        self.assertEqual(self.agent.datagrams, emitter.datagrams_sent)
+        self.assertEqual(self.agent.bytes, emitter.bytes_sent)
+        self.assertLessEqual(self.agent.max_datagram_size, 200)
+        self.assertGreater(self.agent.rate(), 0)
+
+    def test_records_malformed_lines(self):
+        emitter = self.agent.emitter()
+        self.addCleanup(emitter.close)
+        emitter.emit_lines(['my.gauge:1|g', 'my.metric:1|c'])
+        self.assertTrue(self.agent.wait_for(1))
+        self.assertEqual(self.agent.malformed, [b'my.gauge:1|g'])
+        self.assertEqual(self.agent.counter('my.metric'), 1)
+
+    def test_keeps_payloads(self):
+        agent = FakeAgent(keep_payloads=True).start()
+        self.addCleanup(agent.stop)
+        emitter = agent.emitter()
+        self.addCleanup(emitter.close)
+        emitter.emit_lines(['a:1|c'])
+        emitter.emit_lines(['b:1|c', 'c:1|c'])
+        self.assertTrue(agent.wait_for(2))
+        self.assertEqual(agent.payloads, [b'a:1|c', b'b:1|c\nc:1|c'])
+        self.assertEqual(self.agent.payloads, [])
+
+    def test_reset(self):
+        emitter = self.agent.emitter()
+        self.addCleanup(emitter.close)
+        emitter.increment('my.metric')
+        self.assertTrue(self.agent.wait_for(1))
+        self.agent.reset()
+        self.assertEqual(self.agent.datagrams, 0)
+        self.assertEqual(self.agent.series(), {})
+        self.assertEqual(self.agent.rate(), 0.0)
+
+    def test_many_collectors_flushing_at_once(self):
+        sent = []
+
+        def work():
+            emitter = self.agent.emitter()
+            collector = DogstatsdCollector(emitter)
+            for _ in range(10):
+                for i in range(100):
+                    collector.increment('my.metric', tags=['tag:{}'.format(i)])
+                collector.flush(reset=True)
+            emitter.close()
+            sent.append(emitter.datagrams_sent)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(self.agent.wait_for(sum(sent)))
+        self.assertEqual(self.agent.counter('my.metric', ['tag:0']), 40)
+
+
+class UnixFakeAgentTests(TestCase):
+    def test_unix_socket(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'agent.sock')
+        with FakeAgent(path=path, parse=False) as agent:
+            emitter = agent.emitter()
+            self.addCleanup(emitter.close)
+            emitter.emit_lines(['my.metric:1|c'])
+            self.assertTrue(agent.wait_for(1))
+            self.assertEqual(agent.bytes, len(b'my.metric:1|c'))
+            self.assertEqual(agent.series(), {})
+        self.assertFalse(os.path.exists(path))
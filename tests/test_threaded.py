@@ -0,0 +1,192 @@
+import sys
+import threading
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import call
+
+from dogstatsd_collector import ThreadedDogstatsdCollector
+
+
+class ThreadedDogstatsdCollectorTests(TestCase):
+    def setUp(self):
+        super(ThreadedDogstatsdCollectorTests, self).setUp()
+        self.dogstatsd = MagicMock()
+        self.collector = ThreadedDogstatsdCollector(self.dogstatsd)
+
+    def run_threads(self, target, count=8):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def emitted(self, method):
+        totals = {}
+        for args, kwargs in method.call_args_list:
+            key = (args[0], tuple(kwargs['tags']))
+            totals[key] = totals.get(key, 0) + args[1]
+        return totals
+
+    def test_single_thread(self):
+        self.collector.increment('my.metric', tags=['tag1:value1'])
+        self.collector.histogram('my.time', 0.5)
+        self.collector.flush()
+        self.dogstatsd.increment.assert_has_calls([call('my.metric', 1, tags=['tag1:value1'])])
+        self.dogstatsd.histogram.assert_has_calls([call('my.time', 0.5, tags=[])])
+
+    def test_each_thread_gets_own_shard(self):
+        def work():
+            self.collector.increment('my.metric')
+        self.run_threads(work, count=4)
+        self.assertEqual(len(self.collector._shards), 4)
+
+    def test_flush_merges_shards(self):
+        def work():
+            for i in range(1000):
+                self.collector.increment('my.metric', tags=['tag:{}'.format(i % 3)])
+        self.run_threads(work)
+        self.collector.flush()
+        self.assertEqual(self.dogstatsd.increment.call_count, 3)
+        self.assertEqual(self.emitted(self.dogstatsd.increment), {
+            ('my.metric', ('tag:0',)): 8 * 334,
+            ('my.metric', ('tag:1',)): 8 * 333,
+            ('my.metric', ('tag:2',)): 8 * 333,
+        })
+
+    def test_flush_with_reset_emits_only_new_values(self):
+        self.collector.increment('my.metric', 2)
+        self.collector.flush(reset=True)
+        self.collector.flush(reset=True)
+        self.collector.increment('my.metric', 3)
+        self.collector.flush(reset=True)
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 2, tags=[]),
+            call('my.metric', 3, tags=[]),
+        ])
+        self.assertEqual(self.dogstatsd.increment.call_count, 2)
+
+    def test_no_values_lost_when_flushing_concurrently(self):
+        # On free-threaded builds the recording threads run truly in parallel
+        # with the flushing thread.
+        done = threading.Event()
+
+        def flush():
+            while not done.is_set():
+                self.collector.flush(reset=True)
+
+        def work():
+            for _ in range(5000):
+                self.collector.increment('my.metric')
+
+        flusher = threading.Thread(target=flush)
+        flusher.start()
+        self.run_threads(work)
+        done.set()
+        flusher.join()
+        self.collector.flush(reset=True)
+
+        self.assertEqual(self.emitted(self.dogstatsd.increment), {('my.metric', ()): 8 * 5000})
+
+    def test_handles_record_into_calling_threads_shard(self):
+        counter = self.collector.counter('my.metric', tags=['tag1:value1'])
+        timing = self.collector.histogram_handle('my.time')
+
+        def work():
+            for _ in range(1000):
+                counter.add()
+            timing.add(0.5)
+        self.run_threads(work, count=4)
+        self.assertEqual(len(self.collector._shards), 4)
+        self.collector.flush(reset=True)
+        self.assertEqual(self.emitted(self.dogstatsd.increment), {('my.metric', ('tag1:value1',)): 4000})
+        self.assertEqual(self.emitted(self.dogstatsd.histogram), {('my.time', ()): 2.0})
+
+        # Handles stay valid across resets.
+        counter.add(2)
+        self.dogstatsd.reset_mock()
+        self.collector.flush(reset=True)
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 2, tags=['tag1:value1'])
+
+    def test_flush_with_reset_swaps_shard_containers(self):
+        for i in range(100):
+            self.collector.increment('my.metric', tags=['tag:{}'.format(i)])
+        self.collector.flush(reset=True)
+        self.collector.increment('my.metric', tags=['tag:0'])
+        self.dogstatsd.reset_mock()
+        self.collector.flush(reset=True)
+
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 1, tags=['tag:0'])
+        shard = self.collector._shards[0]
+        self.assertEqual(shard.pending, [])
+        self.assertEqual(shard.containers['increment'], {})
+
+    def test_write_in_progress_delays_swapped_containers(self):
+        self.collector.increment('my.metric')
+        shard = self.collector._shards[0]
+        # A write that started before the flush swapped the containers.
+        shard.started += 1
+        container = shard.containers['increment']
+        self.collector.flush(reset=True)
+        self.dogstatsd.increment.assert_not_called()
+        self.collector._record_metric(container, 'my.metric', 2)
+        shard.finished += 1
+
+        self.collector.flush()
+        self.collector.flush(reset=True)
+        self.collector.flush(reset=True)
+        self.assertEqual(self.dogstatsd.increment.call_args_list, [
+            call('my.metric', 3, tags=[]),
+            call('my.metric', 3, tags=[]),
+        ])
+
+    def test_no_values_lost_with_frequent_thread_switches(self):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        self.addCleanup(sys.setswitchinterval, interval)
+        self.test_no_values_lost_when_flushing_concurrently()
+
+    def test_passes_options_to_collector(self):
+        collector = ThreadedDogstatsdCollector(
+            self.dogstatsd, histogram_modes={'my.time': 'summary'}, collect_stats=True,
+        )
+
+        def work():
+            for i in range(1, 101):
+                collector.histogram('my.time', i)
+        self.run_threads(work, count=2)
+        collector.flush(reset=True)
+        self.dogstatsd.increment.assert_called_once_with('my.time.count', 200, tags=[])
+        self.dogstatsd.histogram.assert_any_call('my.time.max', 100, tags=[])
+        self.assertEqual(collector.stats.record_calls, 200)
+
+    def test_series_limits_are_reset_by_flush(self):
+        collector = ThreadedDogstatsdCollector(self.dogstatsd, max_series=1)
+        collector.increment('my.metric', tags=['tag:a'])
+        collector.increment('my.metric', tags=['tag:b'])
+        collector.flush(reset=True)
+        collector.increment('my.metric', tags=['tag:b'])
+        collector.flush(reset=True)
+        self.dogstatsd.increment.assert_has_calls([
+            call('my.metric', 1, tags=['tag:a']),
+            call('my.metric', 1, tags=['overflow:true']),
+            call('my.metric', 1, tags=['tag:b']),
+        ])
+        self.assertEqual(self.dogstatsd.increment.call_count, 3)
+
+    def test_shards_of_exited_threads_are_dropped(self):
+        def record():
+            self.collector.increment('my.metric')
+
+        for _ in range(20):
+            self.run_threads(record, count=10)
+        self.assertEqual(len(self.collector._shards), 200)
+        self.collector.flush(reset=True)
+
+        self.dogstatsd.increment.assert_called_once_with('my.metric', 200, tags=[])
+        self.assertEqual(self.collector._shards, [])
+
+    def test_shards_of_running_threads_are_kept(self):
+        self.collector.increment('my.metric')
+        self.collector.flush(reset=True)
+        self.assertEqual(len(self.collector._shards), 1)
@@ -0,0 +1,148 @@
+import asyncio
+from unittest import TestCase
+
+from mock import MagicMock
+from mock import patch
+
+from dogstatsd_collector import DogstatsdCollector
+from dogstatsd_collector import ThreadedDogstatsdCollector
+
+
+class TimedTests(TestCase):
+    def setUp(self):
+        super(TimedTests, self).setUp()
+        self.dogstatsd = MagicMock()
+        self.collector = DogstatsdCollector(self.dogstatsd, histogram_modes={'my.time': 'samples'})
+        patcher = patch('dogstatsd_collector.timing.perf_counter_ns')
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def recorded(self):
+        self.collector.flush(reset=True)
+        return [args[1] for args, kwargs in self.dogstatsd.histogram.call_args_list]
+
+    def test_context_manager_records_seconds(self):
+        self.clock.side_effect = [1000000000, 1500000000]
+        with self.collector.timed('my.time'):
+            pass
+        self.assertEqual(self.recorded(), [0.5])
+
+    def test_context_manager_records_milliseconds(self):
+        self.clock.side_effect = [0, 2500000]
+        with self.collector.timed('my.time', use_ms=True):
+            pass
+        self.assertEqual(self.recorded(), [2.5])
+
+    def test_records_on_exception(self):
+        self.clock.side_effect = [0, 1000000000]
+        with self.assertRaises(ValueError):
+            with self.collector.timed('my.time'):
+                raise ValueError()
+        self.assertEqual(self.recorded(), [1.0])
+
+    def test_timer_is_reused(self):
+        self.assertIs(
+            self.collector.timed('my.time', tags=['tag1:value1']),
+            self.collector.timed('my.time', tags=['tag1:value1']),
+        )
+        self.assertIsNot(self.collector.timed('my.time'), self.collector.timed('my.time', use_ms=True))
+
+    def test_reentrant(self):
+        self.clock.side_effect = [0, 1000000000, 3000000000, 4000000000]
+        timer = self.collector.timed('my.time')
+        with timer:
+            with timer:
+                pass
+            pass
+        self.assertEqual(self.recorded(), [2.0, 4.0])
+
+    def test_overlapping_asyncio_tasks(self):
+        # Task a enters, then b, then a exits, then b: the blocks overlap
+        # without nesting, and each takes 200ms.
+        self.clock.side_effect = [0, 100000000, 200000000, 300000000]
+        timer = self.collector.timed('my.time')
+
+        async def run():
+            a_entered = asyncio.Event()
+            b_entered = asyncio.Event()
+            a_exited = asyncio.Event()
+
+            async def a():
+                with timer:
+                    a_entered.set()
+                    await b_entered.wait()
+                a_exited.set()
+
+            async def b():
+                await a_entered.wait()
+                with timer:
+                    b_entered.set()
+                    await a_exited.wait()
+
+            await asyncio.gather(a(), b())
+
+        asyncio.run(run())
+        self.assertEqual(self.recorded(), [0.2, 0.2])
+
+    def test_decorator(self):
+        self.clock.side_effect = [0, 1000000000, 0, 2000000000]
+
+        @self.collector.timed('my.time', tags=['tag1:value1'])
+        def work(x):
+            return x * 2
+
+        self.assertEqual(work(2), 4)
+        self.assertEqual(work(3), 6)
+        self.assertEqual(work.__name__, 'work')
+        self.assertEqual(self.recorded(), [1.0, 2.0])
+
+    def test_decorator_times_coroutine_until_it_completes(self):
+        self.clock.side_effect = [0, 3000000000]
+        steps = []
+
+        @self.collector.timed('my.time')
+        async def work(x):
+            await asyncio.sleep(0)
+            steps.append(self.clock.call_count)
+            return x * 2
+
+        self.assertTrue(asyncio.iscoroutinefunction(work))
+        self.assertEqual(asyncio.run(work(2)), 4)
+        # The clock is read once before the coroutine runs and once after.
+        self.assertEqual(steps, [1])
+        self.assertEqual(self.recorded(), [3.0])
+
+    def test_timer_cache_is_bounded(self):
+        self.clock.side_effect = [0, 1000000000]
+        self.collector.MAX_CACHED_TIMERS = 2
+        self.collector.timed('my.time', tags=['request:1'])
+        self.collector.timed('my.time', tags=['request:2'])
+        timer = self.collector.timed('my.time', tags=['request:3'])
+        self.assertIsNot(timer, self.collector.timed('my.time', tags=['request:3']))
+        self.assertEqual(len(self.collector._timers), 2)
+        with timer:
+            pass
+        self.collector.flush()
+        self.dogstatsd.histogram.assert_called_once_with('my.time', 1.0, tags=['request:3'])
+
+    def test_timer_survives_reset(self):
+        self.clock.side_effect = [0, 1000000000, 0, 2000000000]
+        timer = self.collector.timed('my.time')
+        with timer:
+            pass
+        self.assertEqual(self.recorded(), [1.0])
+        with timer:
+            pass
+        self.assertEqual(self.recorded(), [1.0, 2.0])
+
+
+class ThreadedTimedTests(TestCase):
+    def test_records_into_threaded_collector(self):
+        dogstatsd = MagicMock()
+        collector = ThreadedDogstatsdCollector(dogstatsd)
+        with patch('dogstatsd_collector.timing.perf_counter_ns') as clock:
+            clock.side_effect = [0, 1000000000]
+            with collector.timed('my.time', tags=['tag1:value1']):
+                pass
+        collector.flush()
+        dogstatsd.histogram.assert_called_once_with('my.time', 1.0, tags=['tag1:value1'])